@@ -1,6 +1,22 @@
+import sqlite3
 from abc import ABC, abstractmethod
+from dataclasses import fields
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
 from typing import List, Dict, Tuple, Optional
-from core.models import Medicamento
+from core.models import Medicamento, set_batch_timestamp
+
+# Columnas de medicamentos en el orden declarado en el modelo
+_MEDICAMENTO_FIELDS = tuple(f.name for f in fields(Medicamento))
+
+_STORE_SQL = (
+    f"INSERT OR REPLACE INTO medicamentos ({', '.join(_MEDICAMENTO_FIELDS)}) "
+    f"VALUES ({', '.join('?' for _ in _MEDICAMENTO_FIELDS)})"
+)
+
+# Filas por transacción al almacenar (acota el tamaño del WAL)
+_STORE_BATCH_SIZE = 10_000
 
 class BaseInstitution(ABC):
     """Clase base para todas las instituciones de salud mexicanas"""
@@ -8,6 +24,7 @@ class BaseInstitution(ABC):
     def __init__(self, institution_name: str, db_prefix: str):
         self.institution_name = institution_name
         self.db_prefix = db_prefix
+        self.db_path = Path(f"{db_prefix}_medicamentos.db")
         self.last_error = ""
         self.last_stats = {}
     
@@ -38,6 +55,8 @@ class BaseInstitution(ABC):
     
     def sync_data(self) -> Tuple[bool, str]:
         """Sincronización común"""
+        # Una sola marca de tiempo para todo el lote
+        set_batch_timestamp(datetime.now().isoformat())
         try:
             medications = self.parse_institution_data()
             if not medications:
@@ -53,6 +72,39 @@ class BaseInstitution(ABC):
         except Exception as e:
             self.last_error = str(e)
             return False, f"{self.institution_name}_SYNC_ERROR"
+        finally:
+            set_batch_timestamp(None)
+    
+    def _store_medications(self, medications: List[Medicamento]) -> int:
+        """
+        Almacena medicamentos con executemany, un lote por transacción
+        
+        Returns:
+            Número de medicamentos almacenados
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        # El borrado implícito de INSERT OR REPLACE dispara los triggers AFTER DELETE
+        # (índice FTS y contadores del inspector)
+        conn.execute("PRAGMA recursive_triggers=ON")
+        stored = 0
+        try:
+            rows = map(Medicamento.to_row_tuple, medications)
+            for batch in iter(lambda: list(islice(rows, _STORE_BATCH_SIZE)), []):
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(_STORE_SQL, batch)
+                conn.execute("COMMIT")
+                stored += len(batch)
+            if stored:
+                # sqlite_stat1 al día: planificador y conteos del inspector
+                conn.execute("ANALYZE")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        
+        return stored
     
     def is_ready(self) -> Tuple[bool, str]:
         """Verificación común de estado"""
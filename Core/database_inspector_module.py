@@ -4,6 +4,13 @@ Permite recorrer y verificar la normalización de la base de datos
 """
 
 import sqlite3
+import functools
+import json
+import queue
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from pathlib import Path
@@ -11,6 +18,200 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Pool de conexiones por base de datos (clave: ruta absoluta)
+# Mantiene el page cache de SQLite caliente entre llamadas
+_POOL_SIZE = 4
+_POOLS: Dict[str, queue.LifoQueue] = {}
+_POOLS_LOCK = threading.Lock()
+
+# Las conexiones del pool son de solo lectura (mode=ro): el inspector no modifica el
+# esquema; índices, FTS, _counts y estadísticas los crean el módulo de optimización
+# y los módulos de cada institución
+_CONNECTION_PRAGMAS = (
+    "cache_size=-65536",
+    "temp_store=MEMORY",
+    # Lecturas directas de páginas mapeadas (256 MiB), sin copia vía read()
+    "mmap_size=268435456"
+)
+
+# Conteos de normalización en una sola consulta; cada subconsulta usa su índice parcial
+# (idx_med_norm_set / idx_med_norm_null, del módulo de optimización) si existe.
+# Los dos predicados son complementarios, el total es la suma
+_SQL_NORMALIZATION_COUNTS = '''
+    SELECT
+        (SELECT COUNT(*) FROM medicamentos
+         WHERE principio_activo_normalizado IS NOT NULL AND principio_activo_normalizado != ''),
+        (SELECT COUNT(*) FROM medicamentos
+         WHERE principio_activo_normalizado IS NULL OR principio_activo_normalizado = '')
+'''
+
+# Si el módulo de optimización creó _counts (use_counts_table=True), sus triggers
+# mantienen los conteos y se leen en O(1)
+_SQL_COUNTS = "SELECT key, value FROM _counts WHERE key IN ('total', 'normalized')"
+
+# Muestra aleatoria de ejemplos por rowid (en lugar de ORDER BY RANDOM())
+_RANDOM_EXAMPLES_LIMIT = 15
+_RANDOM_CANDIDATES = 30
+
+# Consultas estáticas: el mismo texto SQL en cada llamada permite que la caché
+# de sentencias de sqlite3 (cached_statements) reutilice el plan preparado
+_STATEMENT_CACHE_SIZE = 256
+
+_SQL_SCHEMA_OBJECTS = "SELECT name, type FROM sqlite_master WHERE type IN ('table', 'index')"
+_SQL_MED_COLUMNS = "PRAGMA table_info(medicamentos)"
+# Filas de sqlite_stat1 cuyo primer número es el total de la tabla: la de la tabla
+# misma (idx NULL, o igual a tbl si es WITHOUT ROWID) o la de un índice no parcial;
+# un índice parcial solo cuenta las filas que cumplen su WHERE
+_SQL_STAT1 = """
+    SELECT s.tbl, s.stat FROM sqlite_stat1 s
+    WHERE s.idx IS NULL OR s.idx = s.tbl
+    OR EXISTS (SELECT 1 FROM pragma_index_list(s.tbl) l WHERE l.name = s.idx AND l.partial = 0)
+"""
+_SQL_TABLES = "SELECT name FROM sqlite_master WHERE type='table'"
+_SQL_TABLE_COLUMNS = 'SELECT cid, name, type, "notnull", dflt_value, pk FROM pragma_table_info(?)'
+_SQL_USER_INDEXES = "SELECT name FROM sqlite_master WHERE type='index' AND name NOT LIKE 'sqlite_%'"
+_SQL_NORMALIZATION_META = "SELECT valor = 'true', fecha_actualizacion FROM metadatos_sistema WHERE clave = 'normalizacion_completa'"
+_SQL_PRINCIPIOS_COUNT = "SELECT COUNT(*) FROM principios_activos"
+_SQL_MAX_ROWID = "SELECT MAX(rowid) FROM medicamentos"
+_SQL_SCHEMA_VERSION = "PRAGMA schema_version"
+
+_SQL_SAMPLE = '''
+    SELECT 
+        clave, 
+        descripcion, 
+        nombre_generico, 
+        principio_activo_normalizado,
+        grupo_terapeutico
+    FROM medicamentos 
+    WHERE principio_activo_normalizado IS NOT NULL 
+    AND principio_activo_normalizado != ''
+    LIMIT ?
+'''
+
+# grupos_terapeuticos se guarda separado por comas (GROUP_CONCAT del
+# optimizador); SQLite lo entrega ya como arreglo JSON, escapando barras y comillas
+_SQL_TOP_INGREDIENTS = '''
+    SELECT 
+        principio_activo_normalizado, 
+        total_medicamentos,
+        CASE WHEN grupos_terapeuticos IS NULL OR grupos_terapeuticos = ''
+            THEN '[]'
+            ELSE '["' || REPLACE(REPLACE(REPLACE(grupos_terapeuticos,
+                     '\\', '\\\\'), '"', '\\"'), ',', '","') || '"]'
+        END AS groups_json
+    FROM principios_activos 
+    ORDER BY total_medicamentos DESC 
+    LIMIT 10
+'''
+
+_SQL_MULTI_PRODUCT = '''
+    SELECT 
+        principio_activo_normalizado, 
+        total_medicamentos
+    FROM principios_activos 
+    WHERE total_medicamentos > 1
+    ORDER BY total_medicamentos DESC
+    LIMIT 20
+'''
+
+_SEARCH_LIMIT = 20
+
+_SQL_SEARCH_FTS = f'''
+    SELECT 
+        m.clave,
+        m.descripcion,
+        m.nombre_generico,
+        m.principio_activo_normalizado
+    FROM medicamentos_fts f
+    JOIN medicamentos m ON m.rowid = f.rowid
+    WHERE medicamentos_fts MATCH ?
+    AND m.principio_activo_normalizado IS NOT NULL 
+    AND m.principio_activo_normalizado != ''
+    ORDER BY m.principio_activo_normalizado
+    LIMIT {_SEARCH_LIMIT}
+'''
+
+# Búsqueda por prefijo: una rama por columna para que cada una use su índice NOCASE
+_SQL_SEARCH_PREFIX = ' UNION '.join(
+    f'''
+    SELECT clave, descripcion, nombre_generico, principio_activo_normalizado
+    FROM medicamentos
+    WHERE {column} LIKE ?
+    AND principio_activo_normalizado IS NOT NULL
+    AND principio_activo_normalizado != ''
+    '''
+    for column in ('descripcion', 'nombre_generico', 'principio_activo_normalizado')
+) + f'''
+    ORDER BY principio_activo_normalizado
+    LIMIT {_SEARCH_LIMIT}
+'''
+
+_SQL_SEARCH_LIKE = f'''
+    SELECT 
+        clave,
+        descripcion,
+        nombre_generico,
+        principio_activo_normalizado
+    FROM medicamentos 
+    WHERE (descripcion LIKE ? OR nombre_generico LIKE ? OR principio_activo_normalizado LIKE ?)
+    AND principio_activo_normalizado IS NOT NULL 
+    AND principio_activo_normalizado != ''
+    ORDER BY principio_activo_normalizado
+    LIMIT {_SEARCH_LIMIT}
+'''
+
+_SQL_RANDOM_BY_ROWID = f'''
+    SELECT clave, descripcion, nombre_generico, principio_activo_normalizado
+    FROM medicamentos
+    WHERE rowid IN ({', '.join('?' for _ in range(_RANDOM_CANDIDATES))})
+    AND principio_activo_normalizado IS NOT NULL
+    AND principio_activo_normalizado != ''
+    LIMIT ?
+'''
+
+_SQL_ROWID_RANGES = tuple(
+    f'''
+    SELECT clave, descripcion, nombre_generico, principio_activo_normalizado
+    FROM medicamentos
+    WHERE {where}
+    AND principio_activo_normalizado IS NOT NULL
+    AND principio_activo_normalizado != ''
+    ORDER BY rowid
+    LIMIT ?
+    '''
+    for where in ('rowid >= ?', 'rowid < ?')
+)
+
+def _open_connection(db_path: str) -> sqlite3.Connection:
+    """Abre una conexión de solo lectura configurada para el pool"""
+    conn = sqlite3.connect(
+        Path(db_path).as_uri() + "?mode=ro",
+        uri=True,
+        check_same_thread=False,
+        isolation_level=None,
+        cached_statements=_STATEMENT_CACHE_SIZE
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(f"PRAGMA {pragma}")
+    return conn
+
+def _quote_identifier(name: str) -> str:
+    """Cita un identificador SQL (nombre de tabla) de forma segura"""
+    return '"' + name.replace('"', '""') + '"'
+
+def _fts_prefix_query(term: str) -> str:
+    """Convierte un término libre en una consulta FTS5 de prefijo: "term"*"""
+    return '"' + term.replace('"', '""') + '"*'
+
+def _get_pool(db_path: str) -> queue.LifoQueue:
+    """Obtiene (o crea) el pool asociado a una base de datos"""
+    with _POOLS_LOCK:
+        pool = _POOLS.get(db_path)
+        if pool is None:
+            pool = _POOLS[db_path] = queue.LifoQueue(maxsize=_POOL_SIZE)
+        return pool
+
 class IMSSDatabaseInspector:
     """Inspector para verificar normalización y estado de la base de datos"""
     
@@ -24,60 +225,167 @@ class IMSSDatabaseInspector:
         self.db_path = Path(db_path)
         if not self.db_path.exists():
             raise FileNotFoundError(f"Base de datos no encontrada: {db_path}")
+        
+        self._db_key = str(self.db_path.resolve())
+        self._pool = _get_pool(self._db_key)
+        if self._pool.empty():
+            self._pool.put(_open_connection(self._db_key))
+        
+        self.refresh_schema()
+    
+    @classmethod
+    def get(cls, db_path: str) -> 'IMSSDatabaseInspector':
+        """
+        Obtiene el inspector compartido de una base de datos
+        
+        Reutiliza el pool de conexiones y la caché de esquema entre llamadas;
+        si el esquema cambió desde la última lectura, se vuelve a cargar.
+        
+        Args:
+            db_path: Ruta a la base de datos SQLite
+        """
+        inspector = _cached_inspector(str(Path(db_path).resolve()))
+        inspector._refresh_schema_if_changed()
+        return inspector
     
+    @contextmanager
     def _get_connection(self):
-        """Obtiene conexión a la base de datos"""
-        return sqlite3.connect(self.db_path)
+        """Obtiene una conexión del pool y la devuelve al terminar"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = _open_connection(self._db_key)
+        
+        try:
+            yield conn
+        finally:
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
     
-    def get_database_structure(self) -> Dict:
+    def refresh_schema(self):
         """
-        Obtiene información sobre la estructura de la base de datos
+        Lee una sola vez tablas, índices y columnas de la base de datos
         
-        Returns:
-            Diccionario con información de tablas y columnas
+        Los métodos del inspector consultan estos valores en memoria;
+        llamar de nuevo si el esquema cambia (p. ej. tras optimizar)
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_SCHEMA_VERSION)
+            self._schema_version = cursor.fetchone()[0]
+            cursor.execute(_SQL_SCHEMA_OBJECTS)
+            objects = cursor.fetchall()
+            cursor.execute(_SQL_MED_COLUMNS)
+            self._med_columns = frozenset(col[1] for col in cursor)
+        
+        self._tables = frozenset(name for name, obj_type in objects if obj_type == 'table')
+        self._indexes = frozenset(name for name, obj_type in objects if obj_type == 'index')
+        self._has_principios_tbl = 'principios_activos' in self._tables
+        # Objetos opcionales creados por el módulo de optimización
+        self._has_fts = 'medicamentos_fts' in self._tables
+        self._has_counts = '_counts' in self._tables
+        self._max_rowid = None
+    
+    def _refresh_schema_if_changed(self):
+        """Recarga la caché de esquema si PRAGMA schema_version cambió"""
+        with self._get_connection() as conn:
+            schema_version = conn.execute(_SQL_SCHEMA_VERSION).fetchone()[0]
+        if schema_version != self._schema_version:
+            self.refresh_schema()
+    
+    def _normalization_counts(self, cursor) -> Tuple[int, int]:
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        Cuenta medicamentos normalizados y sin normalizar
         
-        structure = {
-            'tables': {},
-            'indexes': [],
-            'total_size': self.db_path.stat().st_size if self.db_path.exists() else 0
-        }
+        Returns:
+            Tupla (normalizados, sin normalizar)
+        """
+        if self._has_counts:
+            cursor.execute(_SQL_COUNTS)
+            counts = dict(cursor.fetchall())
+            return counts['normalized'], counts['total'] - counts['normalized']
+        
+        # Ambos conteos en una sola consulta (sobre índices parciales)
+        cursor.execute(_SQL_NORMALIZATION_COUNTS)
+        return tuple(cursor.fetchone())
+    
+    def _stat1_row_counts(self, cursor) -> Dict[str, int]:
+        """
+        Conteos de filas registrados por ANALYZE en sqlite_stat1 (si existe)
         
-        # Obtener todas las tablas
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
+        Los módulos que escriben medicamentos vuelven a ejecutar ANALYZE al terminar
+        cada carga, así que las estimaciones siguen al día tras una sincronización
+        """
+        if 'sqlite_stat1' not in self._tables:
+            return {}
+        
+        counts = {}
+        cursor.execute(_SQL_STAT1)
+        for table_name, stat in cursor.fetchall():
+            if table_name not in counts and stat:
+                counts[table_name] = int(stat.split()[0])
+        return counts
+    
+    def get_database_structure(self, size: Optional[int] = None) -> Dict:
+        """
+        Obtiene información sobre la estructura de la base de datos
         
-        for (table_name,) in tables:
-            # Información de columnas
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = cursor.fetchall()
+        Args:
+            size: Tamaño del archivo en bytes si ya se conoce (evita otro stat)
             
-            # Contar registros
-            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-            count = cursor.fetchone()[0]
+        Returns:
+            Diccionario con información de tablas y columnas
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
             
-            structure['tables'][table_name] = {
-                'columns': [
-                    {
-                        'name': col[1],
-                        'type': col[2],
-                        'not_null': bool(col[3]),
-                        'default': col[4],
-                        'primary_key': bool(col[5])
-                    }
-                    for col in columns
-                ],
-                'row_count': count
+            structure = {
+                'tables': {},
+                'indexes': [],
+                'total_size': size if size is not None else self.db_path.stat().st_size
             }
+            
+            # Conteos estimados por ANALYZE (evita un COUNT(*) completo por tabla)
+            stat_counts = self._stat1_row_counts(cursor)
+            
+            # Obtener todas las tablas (solo nombres presentes en sqlite_master)
+            cursor.execute(_SQL_TABLES)
+            tables = cursor.fetchall()
+            
+            for (table_name,) in tables:
+                # Información de columnas (sentencia parametrizada, se prepara una vez)
+                cursor.execute(_SQL_TABLE_COLUMNS, (table_name,))
+                columns = cursor.fetchall()
+                
+                # Contar registros (estimación de sqlite_stat1 o COUNT(*) si no existe)
+                count = stat_counts.get(table_name)
+                is_estimate = count is not None
+                if count is None:
+                    cursor.execute(f"SELECT COUNT(*) FROM {_quote_identifier(table_name)}")
+                    count = cursor.fetchone()[0]
+                
+                structure['tables'][table_name] = {
+                    'columns': [
+                        {
+                            'name': col[1],
+                            'type': col[2],
+                            'not_null': bool(col[3]),
+                            'default': col[4],
+                            'primary_key': bool(col[5])
+                        }
+                        for col in columns
+                    ],
+                    'row_count': count,
+                    'row_count_is_estimate': is_estimate
+                }
+            
+            # Obtener índices
+            cursor.execute(_SQL_USER_INDEXES)
+            indexes = cursor.fetchall()
+            structure['indexes'] = [idx[0] for idx in indexes]
         
-        # Obtener índices
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='index' AND name NOT LIKE 'sqlite_%'")
-        indexes = cursor.fetchall()
-        structure['indexes'] = [idx[0] for idx in indexes]
-        
-        conn.close()
         return structure
     
     def check_normalization_status(self) -> Dict:
@@ -87,55 +395,48 @@ class IMSSDatabaseInspector:
         Returns:
             Diccionario con estado de normalización
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        status = {
-            'normalization_tables_exist': False,
-            'normalization_completed': False,
-            'normalization_date': None,
-            'medicamentos_normalized': 0,
-            'medicamentos_without_normalization': 0,
-            'active_ingredients_found': 0,
-            'optimization_indexes_exist': False
-        }
-        
-        try:
-            # Verificar si existen las tablas de normalización
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name IN ('principios_activos', 'metadatos_sistema')")
-            normalization_tables = [row[0] for row in cursor.fetchall()]
-            status['normalization_tables_exist'] = len(normalization_tables) == 2
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
             
-            # Verificar si la normalización está completada
-            if 'metadatos_sistema' in normalization_tables:
-                cursor.execute("SELECT valor, fecha_actualizacion FROM metadatos_sistema WHERE clave = 'normalizacion_completa'")
-                result = cursor.fetchone()
-                if result:
-                    status['normalization_completed'] = result[0] == 'true'
-                    status['normalization_date'] = result[1]
+            status = {
+                'normalization_tables_exist': False,
+                'normalization_completed': False,
+                'normalization_date': None,
+                'medicamentos_normalized': 0,
+                'medicamentos_without_normalization': 0,
+                'active_ingredients_found': 0,
+                'optimization_indexes_exist': False
+            }
             
-            # Verificar medicamentos normalizados
-            cursor.execute("SELECT name FROM pragma_table_info('medicamentos') WHERE name = 'principio_activo_normalizado'")
-            if cursor.fetchone():
-                cursor.execute("SELECT COUNT(*) FROM medicamentos WHERE principio_activo_normalizado IS NOT NULL AND principio_activo_normalizado != ''")
-                status['medicamentos_normalized'] = cursor.fetchone()[0]
+            try:
+                # Verificar si existen las tablas de normalización
+                status['normalization_tables_exist'] = self._has_principios_tbl and 'metadatos_sistema' in self._tables
                 
-                cursor.execute("SELECT COUNT(*) FROM medicamentos WHERE principio_activo_normalizado IS NULL OR principio_activo_normalizado = ''")
-                status['medicamentos_without_normalization'] = cursor.fetchone()[0]
-            
-            # Verificar principios activos
-            if 'principios_activos' in normalization_tables:
-                cursor.execute("SELECT COUNT(*) FROM principios_activos")
-                status['active_ingredients_found'] = cursor.fetchone()[0]
-            
-            # Verificar índices de optimización
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='index' AND name LIKE '%principio_activo%'")
-            status['optimization_indexes_exist'] = len(cursor.fetchall()) > 0
-            
-        except Exception as e:
-            logger.error(f"Error verificando normalización: {e}")
+                # Verificar si la normalización está completada
+                if 'metadatos_sistema' in self._tables:
+                    cursor.execute(_SQL_NORMALIZATION_META)
+                    result = cursor.fetchone()
+                    if result:
+                        status['normalization_completed'] = bool(result[0])
+                        status['normalization_date'] = result[1]
+                
+                # Verificar medicamentos normalizados
+                if 'principio_activo_normalizado' in self._med_columns:
+                    normalized, unnormalized = self._normalization_counts(cursor)
+                    status['medicamentos_normalized'] = normalized
+                    status['medicamentos_without_normalization'] = unnormalized
+                
+                # Verificar principios activos
+                if self._has_principios_tbl:
+                    cursor.execute(_SQL_PRINCIPIOS_COUNT)
+                    status['active_ingredients_found'] = cursor.fetchone()[0]
+                
+                # Verificar índices de optimización
+                status['optimization_indexes_exist'] = any('principio_activo' in name for name in self._indexes)
+                
+            except Exception as e:
+                logger.error(f"Error verificando normalización: {e}")
         
-        conn.close()
         return status
     
     def sample_normalized_data(self, limit: int = 10) -> List[Dict]:
@@ -148,42 +449,21 @@ class IMSSDatabaseInspector:
         Returns:
             Lista de medicamentos con información de normalización
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        sample_data = []
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            sample_data = []
+            
+            try:
+                # Verificar si existe la columna de normalización
+                if 'principio_activo_normalizado' in self._med_columns:
+                    cursor.execute(_SQL_SAMPLE, (limit,))
+                    
+                    sample_data = [dict(row) for row in cursor]
+            
+            except Exception as e:
+                logger.error(f"Error obteniendo muestra: {e}")
         
-        try:
-            # Verificar si existe la columna de normalización
-            cursor.execute("SELECT name FROM pragma_table_info('medicamentos') WHERE name = 'principio_activo_normalizado'")
-            if cursor.fetchone():
-                cursor.execute('''
-                    SELECT 
-                        clave, 
-                        descripcion, 
-                        nombre_generico, 
-                        principio_activo_normalizado,
-                        grupo_terapeutico
-                    FROM medicamentos 
-                    WHERE principio_activo_normalizado IS NOT NULL 
-                    AND principio_activo_normalizado != ''
-                    LIMIT ?
-                ''', (limit,))
-                
-                results = cursor.fetchall()
-                for row in results:
-                    sample_data.append({
-                        'clave': row[0],
-                        'descripcion': row[1],
-                        'nombre_generico': row[2],
-                        'principio_activo_normalizado': row[3],
-                        'grupo_terapeutico': row[4]
-                    })
-        
-        except Exception as e:
-            logger.error(f"Error obteniendo muestra: {e}")
-        
-        conn.close()
         return sample_data
     
     def analyze_active_ingredients(self) -> Dict:
@@ -193,84 +473,70 @@ class IMSSDatabaseInspector:
         Returns:
             Análisis de principios activos
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            analysis = self._empty_analysis()
+            
+            try:
+                # Verificar si existe la tabla de principios activos
+                if self._has_principios_tbl:
+                    # Top principios activos
+                    cursor.execute(_SQL_TOP_INGREDIENTS)
+                    
+                    analysis['top_ingredients'] = [
+                        {
+                            'ingredient': row['principio_activo_normalizado'],
+                            'medication_count': row['total_medicamentos'],
+                            'therapeutic_groups': json.loads(row['groups_json'], strict=False)
+                        }
+                        for row in cursor
+                    ]
+                    
+                    # Total de ingredientes únicos
+                    cursor.execute(_SQL_PRINCIPIOS_COUNT)
+                    analysis['total_unique_ingredients'] = cursor.fetchone()[0]
+                    
+                    # Ingredientes con múltiples productos
+                    cursor.execute(_SQL_MULTI_PRODUCT)
+                    
+                    analysis['ingredients_with_multiple_products'] = [
+                        {
+                            'ingredient': row['principio_activo_normalizado'],
+                            'product_count': row['total_medicamentos']
+                        }
+                        for row in cursor
+                    ]
+                
+                # Análisis de calidad de normalización
+                if 'principio_activo_normalizado' in self._med_columns:
+                    # Medicamentos sin normalizar y total
+                    normalized, unnormalized = self._normalization_counts(cursor)
+                    total = normalized + unnormalized
+                    
+                    if total > 0:
+                        normalization_percentage = ((total - unnormalized) / total) * 100
+                        analysis['normalization_quality'] = {
+                            'total_medications': total,
+                            'normalized_medications': total - unnormalized,
+                            'unnormalized_medications': unnormalized,
+                            'normalization_percentage': round(normalization_percentage, 2)
+                        }
+            
+            except Exception as e:
+                logger.error(f"Error analizando principios activos: {e}")
         
-        analysis = {
+        return analysis
+    
+    @staticmethod
+    def _empty_analysis() -> Dict:
+        """Análisis vacío (base de datos sin normalizar)"""
+        return {
             'top_ingredients': [],
             'ingredients_with_multiple_products': [],
             'total_unique_ingredients': 0,
             'normalization_quality': {}
         }
-        
-        try:
-            # Verificar si existe la tabla de principios activos
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name = 'principios_activos'")
-            if cursor.fetchone():
-                # Top principios activos
-                cursor.execute('''
-                    SELECT 
-                        principio_activo_normalizado, 
-                        total_medicamentos,
-                        grupos_terapeuticos
-                    FROM principios_activos 
-                    ORDER BY total_medicamentos DESC 
-                    LIMIT 10
-                ''')
-                
-                for row in cursor.fetchall():
-                    analysis['top_ingredients'].append({
-                        'ingredient': row[0],
-                        'medication_count': row[1],
-                        'therapeutic_groups': row[2].split(',') if row[2] else []
-                    })
-                
-                # Total de ingredientes únicos
-                cursor.execute("SELECT COUNT(*) FROM principios_activos")
-                analysis['total_unique_ingredients'] = cursor.fetchone()[0]
-                
-                # Ingredientes con múltiples productos
-                cursor.execute('''
-                    SELECT 
-                        principio_activo_normalizado, 
-                        total_medicamentos
-                    FROM principios_activos 
-                    WHERE total_medicamentos > 1
-                    ORDER BY total_medicamentos DESC
-                    LIMIT 20
-                ''')
-                
-                for row in cursor.fetchall():
-                    analysis['ingredients_with_multiple_products'].append({
-                        'ingredient': row[0],
-                        'product_count': row[1]
-                    })
-            
-            # Análisis de calidad de normalización
-            cursor.execute("SELECT name FROM pragma_table_info('medicamentos') WHERE name = 'principio_activo_normalizado'")
-            if cursor.fetchone():
-                # Medicamentos sin normalizar
-                cursor.execute("SELECT COUNT(*) FROM medicamentos WHERE principio_activo_normalizado IS NULL OR principio_activo_normalizado = ''")
-                unnormalized = cursor.fetchone()[0]
-                
-                # Total de medicamentos
-                cursor.execute("SELECT COUNT(*) FROM medicamentos")
-                total = cursor.fetchone()[0]
-                
-                if total > 0:
-                    normalization_percentage = ((total - unnormalized) / total) * 100
-                    analysis['normalization_quality'] = {
-                        'total_medications': total,
-                        'normalized_medications': total - unnormalized,
-                        'unnormalized_medications': unnormalized,
-                        'normalization_percentage': round(normalization_percentage, 2)
-                    }
-        
-        except Exception as e:
-            logger.error(f"Error analizando principios activos: {e}")
-        
-        conn.close()
-        return analysis
     
     def find_normalization_examples(self, search_term: str = "") -> List[Dict]:
         """
@@ -282,58 +548,85 @@ class IMSSDatabaseInspector:
         Returns:
             Lista de ejemplos de normalización
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            examples = []
+            
+            try:
+                if 'principio_activo_normalizado' in self._med_columns:
+                    if search_term and self._has_fts:
+                        # Buscar ejemplos en el índice de texto completo (prefijo del término)
+                        cursor.execute(_SQL_SEARCH_FTS, (_fts_prefix_query(search_term),))
+                        rows = cursor
+                    elif search_term:
+                        # Primero por prefijo (usa los índices NOCASE)
+                        prefix = f'{search_term}%'
+                        cursor.execute(_SQL_SEARCH_PREFIX, (prefix, prefix, prefix))
+                        rows = cursor.fetchall()
+                        
+                        if len(rows) < _SEARCH_LIMIT:
+                            # Pocos resultados: buscar ejemplos que contengan el término
+                            pattern = f'%{search_term}%'
+                            cursor.execute(_SQL_SEARCH_LIKE, (pattern, pattern, pattern))
+                            rows = cursor
+                    else:
+                        # Obtener ejemplos aleatorios
+                        rows = self._sample_random_rows(cursor, _RANDOM_EXAMPLES_LIMIT)
+                    
+                    examples = [
+                        {
+                            'clave': row['clave'],
+                            'original_description': row['descripcion'],
+                            'generic_name': row['nombre_generico'],
+                            'normalized_ingredient': row['principio_activo_normalizado'],
+                            'normalization_applied': self._show_normalization_process(
+                                row['descripcion'], row['nombre_generico'], row['principio_activo_normalizado']
+                            )
+                        }
+                        for row in rows
+                    ]
+            
+            except Exception as e:
+                logger.error(f"Error buscando ejemplos: {e}")
         
-        examples = []
+        return examples
+    
+    def _get_max_rowid(self, cursor) -> int:
+        """MAX(rowid) de medicamentos, calculado una sola vez"""
+        if self._max_rowid is None:
+            cursor.execute(_SQL_MAX_ROWID)
+            self._max_rowid = cursor.fetchone()[0] or 0
+        return self._max_rowid
+    
+    def _sample_random_rows(self, cursor, limit: int) -> List[Tuple]:
+        """
+        Muestra aleatoria de medicamentos normalizados por rowid
         
-        try:
-            cursor.execute("SELECT name FROM pragma_table_info('medicamentos') WHERE name = 'principio_activo_normalizado'")
-            if cursor.fetchone():
-                if search_term:
-                    # Buscar ejemplos que contengan el término
-                    cursor.execute('''
-                        SELECT 
-                            clave,
-                            descripcion,
-                            nombre_generico,
-                            principio_activo_normalizado
-                        FROM medicamentos 
-                        WHERE (descripcion LIKE ? OR nombre_generico LIKE ? OR principio_activo_normalizado LIKE ?)
-                        AND principio_activo_normalizado IS NOT NULL 
-                        AND principio_activo_normalizado != ''
-                        ORDER BY principio_activo_normalizado
-                        LIMIT 20
-                    ''', (f'%{search_term}%', f'%{search_term}%', f'%{search_term}%'))
-                else:
-                    # Obtener ejemplos aleatorios
-                    cursor.execute('''
-                        SELECT 
-                            clave,
-                            descripcion,
-                            nombre_generico,
-                            principio_activo_normalizado
-                        FROM medicamentos 
-                        WHERE principio_activo_normalizado IS NOT NULL 
-                        AND principio_activo_normalizado != ''
-                        ORDER BY RANDOM()
-                        LIMIT 15
-                    ''')
-                
+        Evita ORDER BY RANDOM() (recorre y ordena toda la tabla): sortea rowids
+        candidatos y los busca en el B-tree; si hay huecos o filas sin normalizar,
+        completa la muestra leyendo a partir de un rowid aleatorio.
+        """
+        max_rowid = self._get_max_rowid(cursor)
+        if max_rowid <= 0:
+            return []
+        
+        candidates = random.sample(range(1, max_rowid + 1), min(_RANDOM_CANDIDATES, max_rowid))
+        # Rellenar hasta _RANDOM_CANDIDATES para usar siempre la misma sentencia
+        candidates += candidates[:1] * (_RANDOM_CANDIDATES - len(candidates))
+        cursor.execute(_SQL_RANDOM_BY_ROWID, (*candidates, limit))
+        rows = {row[0]: row for row in cursor.fetchall()}
+        
+        if len(rows) < limit:
+            start = random.randint(1, max_rowid)
+            for range_sql in _SQL_ROWID_RANGES:
+                cursor.execute(range_sql, (start, limit))
                 for row in cursor.fetchall():
-                    examples.append({
-                        'clave': row[0],
-                        'original_description': row[1],
-                        'generic_name': row[2],
-                        'normalized_ingredient': row[3],
-                        'normalization_applied': self._show_normalization_process(row[1], row[2], row[3])
-                    })
-        
-        except Exception as e:
-            logger.error(f"Error buscando ejemplos: {e}")
-        
-        conn.close()
-        return examples
+                    rows.setdefault(row[0], row)
+                if len(rows) >= limit:
+                    break
+        
+        return list(rows.values())[:limit]
     
     def _show_normalization_process(self, description: str, generic_name: str, normalized: str) -> Dict:
         """Muestra cómo se aplicó el proceso de normalización"""
@@ -351,19 +644,36 @@ class IMSSDatabaseInspector:
         Returns:
             Reporte completo del estado de la base de datos
         """
+        size = self.db_path.stat().st_size
+        
+        # Las consultas son independientes: cada una toma su propia conexión del pool
+        # (en WAL los lectores no se bloquean entre sí)
+        with ThreadPoolExecutor(max_workers=_POOL_SIZE) as executor:
+            structure = executor.submit(self.get_database_structure, size)
+            norm_status = self.check_normalization_status()
+            
+            # Sin tablas ni columna de normalización no hay nada que analizar
+            if norm_status['normalization_tables_exist'] or 'principio_activo_normalizado' in self._med_columns:
+                analysis_future = executor.submit(self.analyze_active_ingredients)
+                sample_future = executor.submit(self.sample_normalized_data, 5)
+                analysis = analysis_future.result()
+                sample_data = sample_future.result()
+            else:
+                analysis = self._empty_analysis()
+                sample_data = []
+        
         report = {
             'timestamp': datetime.now().isoformat(),
             'database_file': str(self.db_path),
-            'file_size_mb': round(self.db_path.stat().st_size / (1024 * 1024), 2),
-            'structure': self.get_database_structure(),
-            'normalization_status': self.check_normalization_status(),
-            'active_ingredients_analysis': self.analyze_active_ingredients(),
-            'sample_data': self.sample_normalized_data(5),
+            'file_size_mb': round(size / (1024 * 1024), 2),
+            'structure': structure.result(),
+            'normalization_status': norm_status,
+            'active_ingredients_analysis': analysis,
+            'sample_data': sample_data,
             'recommendations': []
         }
         
         # Generar recomendaciones
-        norm_status = report['normalization_status']
         
         if not norm_status['normalization_tables_exist']:
             report['recommendations'].append("Ejecutar módulo de optimización para crear tablas de normalización")
@@ -383,6 +693,11 @@ class IMSSDatabaseInspector:
         return report
 
 # Funciones de utilidad para usar el módulo
+@functools.lru_cache(maxsize=4)
+def _cached_inspector(resolved_path: str) -> IMSSDatabaseInspector:
+    """Un inspector por ruta absoluta (ver IMSSDatabaseInspector.get)"""
+    return IMSSDatabaseInspector(resolved_path)
+
 def inspect_database(db_path: str) -> Dict:
     """
     Función de conveniencia para inspeccionar una base de datos
@@ -393,7 +708,7 @@ def inspect_database(db_path: str) -> Dict:
     Returns:
         Reporte de inspección
     """
-    inspector = IMSSDatabaseInspector(db_path)
+    inspector = IMSSDatabaseInspector.get(db_path)
     return inspector.get_inspection_report()
 
 def check_normalization(db_path: str) -> Dict:
@@ -406,7 +721,7 @@ def check_normalization(db_path: str) -> Dict:
     Returns:
         Estado de normalización
     """
-    inspector = IMSSDatabaseInspector(db_path)
+    inspector = IMSSDatabaseInspector.get(db_path)
     return inspector.check_normalization_status()
 
 def show_normalization_examples(db_path: str, search_term: str = "", limit: int = 10) -> List[Dict]:
@@ -421,7 +736,7 @@ def show_normalization_examples(db_path: str, search_term: str = "", limit: int
     Returns:
         Lista de ejemplos
     """
-    inspector = IMSSDatabaseInspector(db_path)
+    inspector = IMSSDatabaseInspector.get(db_path)
     return inspector.find_normalization_examples(search_term)
 
 # Ejemplo de uso del módulo
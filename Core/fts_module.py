@@ -0,0 +1,59 @@
+"""
+Índice de texto completo de medicamentos
+Definición única de medicamentos_fts y sus triggers, para todos los módulos que lo crean
+"""
+
+import sqlite3
+
+# FTS5 de contenido externo sobre medicamentos; los triggers lo mantienen al día.
+# Las altas de IMSS son UPSERT: una clave repetida dispara medicamentos_fts_au, no un
+# borrado; quien use INSERT OR REPLACE debe activar recursive_triggers para que el
+# borrado implícito dispare medicamentos_fts_ad
+_SQL_FTS_SETUP = (
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS medicamentos_fts USING fts5(
+        descripcion, nombre_generico, principio_activo_normalizado,
+        content='medicamentos', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS medicamentos_fts_ai AFTER INSERT ON medicamentos BEGIN
+        INSERT INTO medicamentos_fts(rowid, descripcion, nombre_generico, principio_activo_normalizado)
+        VALUES (new.rowid, new.descripcion, new.nombre_generico, new.principio_activo_normalizado);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS medicamentos_fts_ad AFTER DELETE ON medicamentos BEGIN
+        INSERT INTO medicamentos_fts(medicamentos_fts, rowid, descripcion, nombre_generico, principio_activo_normalizado)
+        VALUES ('delete', old.rowid, old.descripcion, old.nombre_generico, old.principio_activo_normalizado);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS medicamentos_fts_au
+    AFTER UPDATE OF descripcion, nombre_generico, principio_activo_normalizado ON medicamentos BEGIN
+        INSERT INTO medicamentos_fts(medicamentos_fts, rowid, descripcion, nombre_generico, principio_activo_normalizado)
+        VALUES ('delete', old.rowid, old.descripcion, old.nombre_generico, old.principio_activo_normalizado);
+        INSERT INTO medicamentos_fts(rowid, descripcion, nombre_generico, principio_activo_normalizado)
+        VALUES (new.rowid, new.descripcion, new.nombre_generico, new.principio_activo_normalizado);
+    END'''
+)
+
+_SQL_REBUILD_FTS = "INSERT INTO medicamentos_fts(medicamentos_fts) VALUES('rebuild')"
+_SQL_HAS_FTS = "SELECT 1 FROM sqlite_master WHERE type='table' AND name='medicamentos_fts'"
+
+def ensure_medicamentos_fts(conn: sqlite3.Connection):
+    """
+    Crea medicamentos_fts y sus triggers; lo llena si la tabla es nueva
+    
+    Va en un SAVEPOINT, así que sirve con o sin una transacción abierta
+    por el llamador; si falla no deja nada a medias
+    
+    Raises:
+        sqlite3.Error: SQLite sin FTS5, o medicamentos sin las columnas indexadas
+    """
+    nueva = conn.execute(_SQL_HAS_FTS).fetchone() is None
+    conn.execute("SAVEPOINT medicamentos_fts")
+    try:
+        for statement in _SQL_FTS_SETUP:
+            conn.execute(statement)
+        if nueva:
+            conn.execute(_SQL_REBUILD_FTS)
+    except sqlite3.Error:
+        conn.execute("ROLLBACK TO medicamentos_fts")
+        conn.execute("RELEASE medicamentos_fts")
+        raise
+    conn.execute("RELEASE medicamentos_fts")
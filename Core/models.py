@@ -1,8 +1,18 @@
-from dataclasses import dataclass, asdict
-from typing import Dict, Optional
+import dataclasses
+from dataclasses import dataclass
+from operator import attrgetter
+from typing import Dict, Optional, Tuple
 from datetime import datetime
 
-@dataclass
+# Marca de tiempo compartida por todos los medicamentos de una sincronización
+_batch_timestamp: Optional[str] = None
+
+def set_batch_timestamp(timestamp: Optional[str]) -> None:
+    """Fija (o limpia con None) la fecha usada para last_updated en un lote"""
+    global _batch_timestamp
+    _batch_timestamp = timestamp
+
+@dataclass(slots=True)
 class Medicamento:
     """Modelo unificado para medicamentos de todas las instituciones"""
     
@@ -32,7 +42,15 @@ class Medicamento:
     
     def __post_init__(self):
         if not self.last_updated:
-            self.last_updated = datetime.now().isoformat()
+            self.last_updated = _batch_timestamp or datetime.now().isoformat()
     
     def to_dict(self) -> Dict:
-        return asdict(self)
\ No newline at end of file
+        return dict(zip(_FIELDS, _GET(self)))
+    
+    def to_row_tuple(self) -> Tuple:
+        """Valores en el orden de los campos, listo para executemany"""
+        return _GET(self)
+
+# Campos del modelo precalculados (evita la reflexión de asdict por fila)
+_FIELDS = tuple(f.name for f in dataclasses.fields(Medicamento))
+_GET = attrgetter(*_FIELDS)
\ No newline at end of file
@@ -3,14 +3,233 @@ Módulo de Optimización para el Sistema IMSS
 Agrega capacidades de normalización, agrupación y búsqueda rápida
 """
 
+import json
 import re
+import multiprocessing as mp
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import islice
+from pathlib import Path
 from typing import Dict, List, Optional
 import logging
 
+from .fts_module import ensure_medicamentos_fts
+
 logger = logging.getLogger(__name__)
 
+# Normalización dentro de SQLite: norm_pa(descripcion, nombre_generico) es la
+# función SQL registrada en cada conexión (ver _register_functions)
+_SQL_NORMALIZE_ALL = (
+    "UPDATE medicamentos SET principio_activo_normalizado = "
+    "norm_pa(descripcion, COALESCE(nombre_generico, ''))"
+)
+
+# Pool de conexiones por base de datos (clave: ruta absoluta)
+# Las conexiones viven entre llamadas y conservan caliente el page cache
+_POOL_SIZE = 4
+_POOLS: Dict[str, queue.LifoQueue] = {}
+_POOLS_LOCK = threading.Lock()
+
+# Separador de nombres_comerciales: CHAR(31) (separador de unidad) no aparece en
+# las descripciones, a diferencia de la coma de GROUP_CONCAT por omisión.
+# grupos_terapeuticos conserva la coma (también lo lee el inspector)
+_DESCRIPTION_SEPARATOR = '\x1f'
+
+# Catálogos grandes: normalización en paralelo (mp.Pool) y UPDATE por lotes;
+# por debajo del umbral (o con un solo núcleo) el costo de arrancar procesos no
+# compensa y se usa norm_pa
+_PARALLEL_MIN_ROWS = 50_000
+_PARALLEL_CHUNKSIZE = 2000
+_UPDATE_BATCH_SIZE = 10_000
+
+_SQL_UPDATE_NORMALIZED = "UPDATE medicamentos SET principio_activo_normalizado = ? WHERE clave = ?"
+
+# PRAGMAs aplicados una vez, al abrir cada conexión del pool
+_CONNECTION_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-65536",
+    "mmap_size=268435456"
+)
+
+# sqlite3 reutiliza la sentencia preparada si recibe exactamente el mismo texto SQL
+# (caché LRU por conexión); las consultas frecuentes se definen una vez aquí
+_STATEMENT_CACHE_SIZE = 256
+
+# Lee directamente de principios_activos (ya agregada en normalize_database)
+_SQL_FIND_SIMILAR = '''
+    SELECT 
+        principio_activo_normalizado,
+        total_medicamentos,
+        grupos_terapeuticos,
+        claves_concat,
+        nombres_comerciales
+    FROM principios_activos
+    WHERE principio_activo_normalizado LIKE ?
+    ORDER BY total_medicamentos DESC
+    LIMIT ?
+'''
+
+# Estado de optimización: cada fila es (sonda, 0/1)
+_SQL_OPTIMIZATION_STATUS_NO_META = '''
+    SELECT 'tbl', COUNT(*) FROM sqlite_master WHERE type='table' AND name='principios_activos'
+    UNION ALL
+    SELECT 'idx', COUNT(*) FROM sqlite_master WHERE type='index' AND name='idx_principio_activo'
+'''
+_SQL_OPTIMIZATION_STATUS = _SQL_OPTIMIZATION_STATUS_NO_META + '''
+    UNION ALL
+    SELECT 'norm', COALESCE(MAX(valor = 'true'), 0) FROM metadatos_sistema WHERE clave = 'normalizacion_completa'
+'''
+
+# Misma búsqueda sobre el índice de texto completo (prefijo de token, sin recorrer la tabla)
+_SQL_FIND_SIMILAR_FTS = '''
+    SELECT 
+        principio_activo_normalizado,
+        total_medicamentos,
+        grupos_terapeuticos,
+        claves_concat,
+        nombres_comerciales
+    FROM principios_activos
+    WHERE id IN (
+        SELECT rowid FROM principios_activos_fts WHERE principios_activos_fts MATCH ?
+    )
+    ORDER BY total_medicamentos DESC
+    LIMIT ?
+'''
+
+# Índice FTS5 de contenido externo; principios_activos solo se reescribe en
+# normalize_database, que lo reconstruye al terminar (no necesita triggers)
+_SQL_CREATE_FTS = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS principios_activos_fts USING fts5(
+        principio_activo_normalizado,
+        content='principios_activos', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+'''
+_SQL_REBUILD_FTS = "INSERT INTO principios_activos_fts(principios_activos_fts) VALUES('rebuild')"
+_SQL_HAS_FTS = "SELECT 1 FROM sqlite_master WHERE type='table' AND name='principios_activos_fts'"
+
+# Índices parciales: los conteos de normalización del inspector se resuelven solo con el índice
+_NORMALIZATION_INDEXES = (
+    """CREATE INDEX IF NOT EXISTS idx_med_norm_set ON medicamentos(principio_activo_normalizado)
+       WHERE principio_activo_normalizado IS NOT NULL AND principio_activo_normalizado != ''""",
+    """CREATE INDEX IF NOT EXISTS idx_med_norm_null ON medicamentos(principio_activo_normalizado)
+       WHERE principio_activo_normalizado IS NULL OR principio_activo_normalizado = ''"""
+)
+
+# Sin FTS5: índices NOCASE para que LIKE 'term%' (búsquedas del inspector) use el
+# B-tree en vez de recorrer la tabla; los dos primeros también los crea el esquema IMSS
+_PREFIX_SEARCH_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_med_desc_nocase ON medicamentos(descripcion COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS idx_med_generico_nocase ON medicamentos(nombre_generico COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS idx_med_norm_nocase ON medicamentos(principio_activo_normalizado COLLATE NOCASE)"
+)
+
+# Contadores mantenidos por triggers (opcional, use_counts_table=True): el inspector
+# lee de _counts los conteos de normalización en O(1) en vez de recorrer índices.
+# Los módulos que escriben medicamentos activan recursive_triggers, así que el
+# borrado implícito de un INSERT OR REPLACE también dispara med_counts_ad.
+_COUNTS_SETUP = (
+    "CREATE TABLE IF NOT EXISTS _counts (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO _counts (key, value) SELECT 'total', COUNT(*) FROM medicamentos",
+    """INSERT OR IGNORE INTO _counts (key, value)
+       SELECT 'normalized', COUNT(*) FROM medicamentos
+       WHERE principio_activo_normalizado IS NOT NULL AND principio_activo_normalizado != ''""",
+    """CREATE TRIGGER IF NOT EXISTS med_counts_ai AFTER INSERT ON medicamentos BEGIN
+        UPDATE _counts SET value = value + 1 WHERE key = 'total';
+        UPDATE _counts SET value = value + 1 WHERE key = 'normalized'
+        AND new.principio_activo_normalizado IS NOT NULL AND new.principio_activo_normalizado != '';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS med_counts_ad AFTER DELETE ON medicamentos BEGIN
+        UPDATE _counts SET value = value - 1 WHERE key = 'total';
+        UPDATE _counts SET value = value - 1 WHERE key = 'normalized'
+        AND old.principio_activo_normalizado IS NOT NULL AND old.principio_activo_normalizado != '';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS med_counts_au AFTER UPDATE OF principio_activo_normalizado ON medicamentos BEGIN
+        UPDATE _counts SET value = value
+            + (new.principio_activo_normalizado IS NOT NULL AND new.principio_activo_normalizado != '')
+            - (old.principio_activo_normalizado IS NOT NULL AND old.principio_activo_normalizado != '')
+        WHERE key = 'normalized';
+    END"""
+)
+
+_SQL_HAS_MED_STATS = "SELECT EXISTS(SELECT 1 FROM sqlite_stat1 WHERE tbl = 'medicamentos')"
+
+# Filas anteriores a claves_concat: se agregan desde medicamentos (usa idx_principio_activo)
+_SQL_FIND_SIMILAR_LEGACY = '''
+    SELECT 
+        GROUP_CONCAT(clave, '|') as claves,
+        GROUP_CONCAT(descripcion, CHAR(31)) as descripciones
+    FROM medicamentos
+    WHERE principio_activo_normalizado = ?
+'''
+
+# Exploración: grupos terapéuticos ('g', por cantidad) y categorías ('c', por
+# nombre, como el GROUP BY) en un solo recorrido de ida y vuelta
+_SQL_EXPLORATION_GROUPS = '''
+    SELECT kind, key, cantidad FROM (
+        SELECT 'g' AS kind, grupo_terapeutico AS key, COUNT(*) AS cantidad
+        FROM medicamentos 
+        WHERE grupo_terapeutico != '' 
+        GROUP BY grupo_terapeutico
+        UNION ALL
+        SELECT 'c', categoria_medicamento, COUNT(*)
+        FROM medicamentos 
+        GROUP BY categoria_medicamento
+    )
+    ORDER BY kind DESC, CASE kind WHEN 'g' THEN -cantidad ELSE 0 END, key
+'''
+
+# Principios activos más comunes (ya calculados en principios_activos)
+_SQL_TOP_INGREDIENTS = '''
+    SELECT principio_activo_normalizado, total_medicamentos 
+    FROM principios_activos 
+    ORDER BY total_medicamentos DESC 
+    LIMIT 10
+'''
+
+# Resúmenes de exploración materializados en metadatos_sistema al normalizar.
+# La marca 'resumen_vigente' la borran triggers en cuanto medicamentos cambia
+# (altas, bajas o cambios de grupo/categoría); sin ella los resúmenes se
+# recalculan en vivo
+_EXPLORATION_SUMMARY_KEYS = ('top_active_ingredients', 'therapeutic_groups', 'by_category')
+_SUMMARY_VALID_KEY = 'resumen_vigente'
+_SUMMARY_INVALIDATION_TRIGGERS = tuple(
+    f'''CREATE TRIGGER IF NOT EXISTS med_resumen_{sufijo} AFTER {evento} ON medicamentos BEGIN
+        DELETE FROM metadatos_sistema WHERE clave = '{_SUMMARY_VALID_KEY}';
+    END'''
+    for sufijo, evento in (
+        ('ai', 'INSERT'),
+        ('ad', 'DELETE'),
+        ('au', 'UPDATE OF grupo_terapeutico, categoria_medicamento')
+    )
+)
+_SQL_READ_SUMMARIES = '''
+    SELECT clave, valor FROM metadatos_sistema 
+    WHERE clave IN (?, ?, ?, ?)
+'''
+_SQL_SYSTEM_METADATA = '''
+    SELECT clave, valor, fecha_actualizacion FROM metadatos_sistema 
+    WHERE clave NOT IN (?, ?, ?, ?)
+'''
+
+# Patrones de normalización compilados una sola vez; todo lo que se elimina
+# (sales, concentraciones, formas farmacéuticas, palabras irrelevantes y
+# caracteres especiales) va en una sola alternación: una pasada por texto
+_RE_STRIP = re.compile(
+    r'\b(?:clorhidrato|sulfato|besilato|maleato|tartrato|citrato|acetato|bromuro)\s+(?:de\s+)?'
+    r'|\d+(?:\.\d+)?\s*(?:mg|g|ml|mcg|μg|ui|%|mEq)'
+    r'|\b(?:tableta|capsula|ampolleta|solucion|crema|gel|jarabe|supositorio|parche)\b'
+    r'|\b(?:cada|contiene|envase|con)\b'
+    r'|[^\w\s]',
+    re.IGNORECASE
+)
+_RE_WS = re.compile(r'\s+')
+
 class IMSSOptimizationModule:
     """Módulo de optimización para el sistema IMSS existente"""
     
@@ -23,62 +242,160 @@ class IMSSOptimizationModule:
         """
         self.db_path = db_connection if isinstance(db_connection, str) else None
         self.conn = db_connection if not isinstance(db_connection, str) else None
-    
-    def _get_connection(self):
-        """Obtiene conexión a la base de datos"""
+        self._has_fts = None
+        
         if self.conn:
-            return self.conn
+            # La conexión del llamador conserva su row_factory; los accesos por
+            # nombre usan cursores propios con sqlite3.Row
+            _register_functions(self.conn)
         else:
-            return sqlite3.connect(str(self.db_path))
+            self._db_key = str(Path(self.db_path).resolve())
+            self._pool = _get_pool(self._db_key)
     
-    def setup_optimization_tables(self):
-        """Configura las tablas necesarias para optimización"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+    @contextmanager
+    def _get_connection(self):
+        """Obtiene conexión a la base de datos (del pool si se usa un path)"""
+        if self.conn:
+            yield self.conn
+            return
         
-        # Agregar columna de principio activo normalizado si no existe
         try:
-            cursor.execute('ALTER TABLE medicamentos ADD COLUMN principio_activo_normalizado TEXT')
-        except sqlite3.OperationalError:
-            pass  # La columna ya existe
-        
-        # Tabla para agrupar medicamentos por principio activo
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS principios_activos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                principio_activo_normalizado TEXT UNIQUE,
-                nombres_comerciales TEXT,
-                total_medicamentos INTEGER,
-                grupos_terapeuticos TEXT,
-                fecha_normalizacion TEXT
-            )
-        ''')
-        
-        # Tabla de metadatos para evitar procesamientos repetidos
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS metadatos_sistema (
-                clave TEXT PRIMARY KEY,
-                valor TEXT,
-                fecha_actualizacion TEXT
-            )
-        ''')
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = _open_connection(self._db_key)
         
-        # Crear índices optimizados
-        indices = [
-            'CREATE INDEX IF NOT EXISTS idx_principio_activo ON medicamentos(principio_activo_normalizado)',
-            'CREATE INDEX IF NOT EXISTS idx_optimized_search ON medicamentos(principio_activo_normalizado, grupo_terapeutico)',
-            'CREATE INDEX IF NOT EXISTS idx_categoria_estado ON medicamentos(categoria_medicamento, estado)'
-        ]
+        try:
+            yield conn
+        finally:
+            # No devolver al pool una transacción a medias
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+    
+    def setup_optimization_tables(self, use_counts_table: bool = False):
+        """
+        Configura las tablas necesarias para optimización
         
-        for indice in indices:
-            cursor.execute(indice)
+        También crea lo que el inspector de base de datos solo lee: índices de
+        normalización, medicamentos_fts, _counts y las estadísticas de ANALYZE
         
-        conn.commit()
-        if self.db_path:  # Solo cerrar si abrimos la conexión aquí
-            conn.close()
+        Args:
+            use_counts_table: Mantener la tabla _counts con triggers para los conteos
+                de normalización (agrega costo a cada escritura en medicamentos)
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Todo el DDL en una sola transacción (un solo commit)
+            if not conn.in_transaction:
+                cursor.execute("BEGIN")
+            
+            # Agregar columna de principio activo normalizado si no existe
+            try:
+                cursor.execute('ALTER TABLE medicamentos ADD COLUMN principio_activo_normalizado TEXT')
+            except sqlite3.OperationalError:
+                pass  # La columna ya existe
+            
+            # Tabla para agrupar medicamentos por principio activo
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS principios_activos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    principio_activo_normalizado TEXT UNIQUE,
+                    nombres_comerciales TEXT,
+                    total_medicamentos INTEGER,
+                    grupos_terapeuticos TEXT,
+                    fecha_normalizacion TEXT,
+                    claves_concat TEXT
+                )
+            ''')
+            
+            # Bases creadas antes de claves_concat
+            try:
+                cursor.execute('ALTER TABLE principios_activos ADD COLUMN claves_concat TEXT')
+            except sqlite3.OperationalError:
+                pass  # La columna ya existe
+            
+            # Tabla de metadatos para evitar procesamientos repetidos
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS metadatos_sistema (
+                    clave TEXT PRIMARY KEY,
+                    valor TEXT,
+                    fecha_actualizacion TEXT
+                )
+            ''')
+            
+            # Crear índices optimizados
+            indices = [
+                'CREATE INDEX IF NOT EXISTS idx_principio_activo ON medicamentos(principio_activo_normalizado)',
+                'CREATE INDEX IF NOT EXISTS idx_optimized_search ON medicamentos(principio_activo_normalizado, grupo_terapeutico)',
+                'CREATE INDEX IF NOT EXISTS idx_categoria_estado ON medicamentos(categoria_medicamento, estado)',
+                # GROUP BY grupo_terapeutico por índice (mismo nombre que el esquema IMSS: no se duplica)
+                'CREATE INDEX IF NOT EXISTS idx_grupo ON medicamentos(grupo_terapeutico)',
+                *_NORMALIZATION_INDEXES
+            ]
+            
+            for indice in indices:
+                cursor.execute(indice)
+            
+            for trigger in _SUMMARY_INVALIDATION_TRIGGERS:
+                cursor.execute(trigger)
+            
+            self._ensure_fts(conn)
+            self._ensure_medicamentos_fts(conn)
+            
+            if use_counts_table:
+                for statement in _COUNTS_SETUP:
+                    cursor.execute(statement)
+            
+            conn.commit()
+            
+            self._ensure_statistics(cursor)
         
         logger.info("Tablas de optimización configuradas")
     
+    def _ensure_fts(self, conn: sqlite3.Connection):
+        """Crea principios_activos_fts (y lo llena si la tabla ya tenía datos)"""
+        try:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_HAS_FTS)
+            if cursor.fetchone() is None:
+                cursor.execute(_SQL_CREATE_FTS)
+                cursor.execute(_SQL_REBUILD_FTS)
+            self._has_fts = True
+        except sqlite3.OperationalError as e:
+            # SQLite sin FTS5: se mantiene la búsqueda con LIKE
+            logger.warning(f"No se pudo crear el índice de texto completo: {e}")
+            self._has_fts = False
+    
+    def _ensure_medicamentos_fts(self, conn: sqlite3.Connection):
+        """Crea medicamentos_fts; sin FTS5, los índices NOCASE para las búsquedas con LIKE"""
+        try:
+            ensure_medicamentos_fts(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"No se pudo crear el índice de texto completo de medicamentos: {e}")
+            for index_sql in _PREFIX_SEARCH_INDEXES:
+                conn.execute(index_sql)
+    
+    def _ensure_statistics(self, cursor):
+        """Ejecuta ANALYZE una vez si sqlite_stat1 no tiene datos de medicamentos"""
+        try:
+            cursor.execute(_SQL_HAS_MED_STATS)
+            if cursor.fetchone()[0]:
+                return
+        except sqlite3.OperationalError:
+            pass  # Aún no existe sqlite_stat1
+        cursor.execute("ANALYZE")
+    
+    def _fts_available(self, cursor) -> bool:
+        """Indica (una sola vez por instancia) si existe principios_activos_fts"""
+        if self._has_fts is None:
+            cursor.execute(_SQL_HAS_FTS)
+            self._has_fts = cursor.fetchone() is not None
+        return self._has_fts
+    
     def normalize_active_ingredient(self, descripcion: str, nombre_generico: str = "") -> str:
         """
         Normaliza el principio activo para detectar medicamentos similares
@@ -90,23 +407,19 @@ class IMSSOptimizationModule:
         Returns:
             Principio activo normalizado
         """
-        texto_base = nombre_generico or descripcion
-        
-        # Remover prefijos/sufijos comunes de sales
-        texto = re.sub(r'\b(clorhidrato|sulfato|besilato|maleato|tartrato|citrato|acetato|bromuro)\s+(de\s+)?', '', texto_base.lower())
-        
-        # Remover concentraciones
-        texto = re.sub(r'\d+(\.\d+)?\s*(mg|g|ml|mcg|μg|ui|%|mEq)', '', texto)
-        
-        # Remover formas farmacéuticas
-        texto = re.sub(r'\b(tableta|capsula|ampolleta|solucion|crema|gel|jarabe|supositorio|parche)\b', '', texto)
+        return self._normalize_static(descripcion, nombre_generico)
+    
+    @staticmethod
+    def _normalize_static(descripcion: str, nombre_generico: str = "") -> str:
+        """Normalización pura (sin estado); también se registra en SQLite como norm_pa"""
+        texto_base = nombre_generico or descripcion or ""
         
-        # Remover palabras irrelevantes
-        texto = re.sub(r'\b(cada|contiene|envase|con)\b', '', texto)
+        # Remover sales, concentraciones, formas farmacéuticas, palabras
+        # irrelevantes y caracteres especiales
+        texto = _RE_STRIP.sub('', texto_base.lower())
         
-        # Normalizar espacios y caracteres especiales
-        texto = re.sub(r'[^\w\s]', '', texto)
-        texto = re.sub(r'\s+', ' ', texto).strip()
+        # Normalizar espacios
+        texto = _RE_WS.sub(' ', texto).strip()
         
         return texto.upper() if texto else ""
     
@@ -117,69 +430,77 @@ class IMSSOptimizationModule:
         Returns:
             Diccionario con estadísticas del proceso
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        # Verificar si ya fue normalizada
-        cursor.execute("SELECT valor FROM metadatos_sistema WHERE clave = 'normalizacion_completa'")
-        resultado = cursor.fetchone()
-        
-        if resultado and resultado[0] == 'true':
-            logger.info("Base de datos ya normalizada")
-            if self.db_path:
-                conn.close()
-            return self._get_normalization_stats()
-        
-        logger.info("Iniciando normalización de base de datos...")
-        
-        # 1. Actualizar principios activos normalizados
-        cursor.execute("SELECT clave, descripcion, nombre_generico FROM medicamentos")
-        medicamentos = cursor.fetchall()
-        
-        actualizaciones = 0
-        for clave, descripcion, nombre_generico in medicamentos:
-            principio_normalizado = self.normalize_active_ingredient(descripcion, nombre_generico or "")
-            cursor.execute(
-                "UPDATE medicamentos SET principio_activo_normalizado = ? WHERE clave = ?",
-                (principio_normalizado, clave)
-            )
-            actualizaciones += 1
-        
-        # 2. Generar tabla de principios activos agrupados
-        cursor.execute("DELETE FROM principios_activos")
-        
-        cursor.execute('''
-            SELECT 
-                principio_activo_normalizado,
-                GROUP_CONCAT(descripcion) as nombres_comerciales,
-                COUNT(*) as total_medicamentos,
-                GROUP_CONCAT(grupo_terapeutico) as grupos_terapeuticos
-            FROM medicamentos 
-            WHERE principio_activo_normalizado != '' AND principio_activo_normalizado IS NOT NULL
-            GROUP BY principio_activo_normalizado
-            ORDER BY COUNT(*) DESC
-        ''')
-        
-        grupos_principios = cursor.fetchall()
-        principios_insertados = 0
-        
-        for principio, nombres, total, grupos in grupos_principios:
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            
+            # Verificar si ya fue normalizada
+            cursor.execute("SELECT valor FROM metadatos_sistema WHERE clave = 'normalizacion_completa'")
+            resultado = cursor.fetchone()
+            
+            if resultado and resultado[0] == 'true':
+                logger.info("Base de datos ya normalizada")
+                return self._get_normalization_stats()
+            
+            logger.info("Iniciando normalización de base de datos...")
+            
+            # 1. Actualizar principios activos normalizados
+            if not conn.in_transaction:
+                cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT COUNT(*) FROM medicamentos")
+            if cursor.fetchone()[0] >= _PARALLEL_MIN_ROWS and mp.cpu_count() > 1:
+                actualizaciones = self._normalize_in_parallel(cursor)
+            else:
+                # Un solo UPDATE con norm_pa
+                cursor.execute(_SQL_NORMALIZE_ALL)
+                actualizaciones = cursor.rowcount
+            
+            # 2. Generar tabla de principios activos agrupados
+            cursor.execute("DELETE FROM principios_activos")
+            
+            # Agregación e inserción dentro de SQLite, sin pasar filas por Python
             cursor.execute('''
                 INSERT INTO principios_activos 
-                (principio_activo_normalizado, nombres_comerciales, total_medicamentos, grupos_terapeuticos, fecha_normalizacion)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (principio, nombres, total, grupos, datetime.now().isoformat()))
-            principios_insertados += 1
-        
-        # 3. Marcar como normalizada
-        cursor.execute('''
-            INSERT OR REPLACE INTO metadatos_sistema (clave, valor, fecha_actualizacion)
-            VALUES ('normalizacion_completa', 'true', ?)
-        ''', (datetime.now().isoformat(),))
-        
-        conn.commit()
-        if self.db_path:
-            conn.close()
+                (principio_activo_normalizado, nombres_comerciales, total_medicamentos, grupos_terapeuticos, fecha_normalizacion, claves_concat)
+                SELECT 
+                    principio_activo_normalizado,
+                    GROUP_CONCAT(descripcion, CHAR(31)) as nombres_comerciales,
+                    COUNT(*) as total_medicamentos,
+                    GROUP_CONCAT(grupo_terapeutico) as grupos_terapeuticos,
+                    ? as fecha_normalizacion,
+                    GROUP_CONCAT(clave, '|') as claves_concat
+                FROM medicamentos 
+                WHERE principio_activo_normalizado != '' AND principio_activo_normalizado IS NOT NULL
+                GROUP BY principio_activo_normalizado
+                ORDER BY COUNT(*) DESC
+            ''', (datetime.now().isoformat(),))
+            principios_insertados = cursor.rowcount
+            
+            if self._fts_available(cursor):
+                cursor.execute(_SQL_REBUILD_FTS)
+            
+            # Resúmenes de exploración: se leen luego con una búsqueda por clave
+            fecha = datetime.now().isoformat()
+            resumen = self._compute_exploration_summary(cursor)
+            resumen[_SUMMARY_VALID_KEY] = True
+            cursor.executemany('''
+                INSERT OR REPLACE INTO metadatos_sistema (clave, valor, fecha_actualizacion)
+                VALUES (?, ?, ?)
+            ''', [
+                (clave, json.dumps(valor, ensure_ascii=False), fecha)
+                for clave, valor in resumen.items()
+            ])
+            
+            # 3. Marcar como normalizada
+            cursor.execute('''
+                INSERT OR REPLACE INTO metadatos_sistema (clave, valor, fecha_actualizacion)
+                VALUES ('normalizacion_completa', 'true', ?)
+            ''', (datetime.now().isoformat(),))
+            
+            conn.commit()
+            
+            # Estadísticas para que el planificador elija los índices nuevos
+            cursor.execute("ANALYZE")
         
         logger.info(f"Normalización completada: {actualizaciones} medicamentos, {principios_insertados} principios activos")
         
@@ -189,19 +510,50 @@ class IMSSOptimizationModule:
             'estado': 'completada'
         }
     
-    def _get_normalization_stats(self) -> Dict[str, int]:
-        """Obtiene estadísticas de normalización existente"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM medicamentos WHERE principio_activo_normalizado != ''")
-        medicamentos_normalizados = cursor.fetchone()[0]
+    def _normalize_in_parallel(self, cursor) -> int:
+        """
+        Normaliza medicamentos repartiendo el trabajo entre procesos
         
-        cursor.execute("SELECT COUNT(*) FROM principios_activos")
-        principios_unicos = cursor.fetchone()[0]
+        Args:
+            cursor: Cursor dentro de la transacción de normalize_database
+            
+        Returns:
+            Número de medicamentos actualizados
+        """
+        # Cursor propio para la lectura: los UPDATE van por `cursor` sin invalidarla.
+        # Se lee por lotes desde este hilo (la conexión no se comparte con el
+        # hilo interno del pool); la memoria queda acotada a un lote.
+        # Tuplas simples: sqlite3.Row no se puede serializar hacia los procesos.
+        # 'spawn' porque el optimizador corre junto a hilos (pool de conexiones del
+        # inspector, hilos de sincronización) y fork puede heredar locks tomados
+        lectura = cursor.connection.cursor()
+        lectura.row_factory = None
+        lectura.execute("SELECT clave, descripcion, nombre_generico FROM medicamentos")
         
-        if self.db_path:
-            conn.close()
+        actualizaciones = 0
+        with mp.get_context('spawn').Pool() as pool:
+            while True:
+                lote = list(islice(lectura, _UPDATE_BATCH_SIZE))
+                if not lote:
+                    break
+                cursor.executemany(
+                    _SQL_UPDATE_NORMALIZED,
+                    pool.imap_unordered(_normalize_pair, lote, chunksize=_PARALLEL_CHUNKSIZE)
+                )
+                actualizaciones += len(lote)
+        
+        return actualizaciones
+    
+    def _get_normalization_stats(self) -> Dict[str, int]:
+        """Obtiene estadísticas de normalización existente"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT COUNT(*) FROM medicamentos WHERE principio_activo_normalizado != ''")
+            medicamentos_normalizados = cursor.fetchone()[0]
+            
+            cursor.execute("SELECT COUNT(*) FROM principios_activos")
+            principios_unicos = cursor.fetchone()[0]
         
         return {
             'medicamentos_actualizados': medicamentos_normalizados,
@@ -209,50 +561,52 @@ class IMSSOptimizationModule:
             'estado': 'ya_completada'
         }
     
-    def find_similar_medications(self, search_term: str) -> List[Dict]:
+    def find_similar_medications(self, search_term: str, limit: Optional[int] = None) -> List[Dict]:
         """
         Busca medicamentos similares por principio activo (RÁPIDO)
         
         Args:
             search_term: Término de búsqueda
+            limit: Máximo de grupos a devolver (None = todos)
             
         Returns:
             Lista de grupos de medicamentos similares
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        # Normalizar término de búsqueda
-        search_normalized = self.normalize_active_ingredient("", search_term)
-        
-        # Buscar en tabla optimizada
-        cursor.execute('''
-            SELECT 
-                pa.principio_activo_normalizado,
-                pa.total_medicamentos,
-                pa.grupos_terapeuticos,
-                GROUP_CONCAT(m.clave, '|') as claves,
-                GROUP_CONCAT(m.descripcion) as descripciones
-            FROM principios_activos pa
-            JOIN medicamentos m ON pa.principio_activo_normalizado = m.principio_activo_normalizado
-            WHERE pa.principio_activo_normalizado LIKE ? COLLATE NOCASE
-            GROUP BY pa.principio_activo_normalizado
-            ORDER BY pa.total_medicamentos DESC
-        ''', (f"%{search_normalized}%",))
-        
-        resultados = []
-        for row in cursor.fetchall():
-            principio, total, grupos, claves, descripciones = row
-            resultados.append({
-                'principio_activo': principio,
-                'total_medicamentos': total,
-                'grupos_terapeuticos': grupos.split(', ') if grupos else [],
-                'claves': claves.split('|') if claves else [],
-                'descripciones': descripciones.split(' | ') if descripciones else []
-            })
-        
-        if self.db_path:
-            conn.close()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Normalizar término de búsqueda
+            search_normalized = self.normalize_active_ingredient("", search_term)
+            
+            # Buscar en tabla optimizada
+            # LIMIT -1 en SQLite equivale a sin límite
+            sql_limit = -1 if limit is None else limit
+            
+            rows = []
+            if search_normalized and self._fts_available(cursor):
+                # Prefijo de frase en FTS5: "TERM"*
+                fts_query = '"' + search_normalized.replace('"', '""') + '"*'
+                cursor.execute(_SQL_FIND_SIMILAR_FTS, (fts_query, sql_limit))
+                rows = cursor.fetchall()
+            
+            if not rows:
+                # Sin FTS5 o sin coincidencias por token: búsqueda por subcadena
+                cursor.execute(_SQL_FIND_SIMILAR, (f"%{search_normalized}%", sql_limit))
+                rows = cursor.fetchall()
+            
+            resultados = []
+            for row in rows:
+                principio, total, grupos, claves, descripciones = row
+                if claves is None:
+                    cursor.execute(_SQL_FIND_SIMILAR_LEGACY, (principio,))
+                    claves, descripciones = cursor.fetchone()
+                resultados.append({
+                    'principio_activo': principio,
+                    'total_medicamentos': total,
+                    'grupos_terapeuticos': grupos.split(',') if grupos else [],
+                    'claves': claves.split('|') if claves else [],
+                    'descripciones': descripciones.split(_DESCRIPTION_SEPARATOR) if descripciones else []
+                })
         
         return resultados
     
@@ -263,58 +617,77 @@ class IMSSOptimizationModule:
         Returns:
             Diccionario con datos de exploración pre-calculados
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            
+            # 1 a 3. Resúmenes materializados en normalize_database, si siguen vigentes
+            exploration = self._read_exploration_summary(cursor)
+            if exploration is None:
+                exploration = self._compute_exploration_summary(cursor)
+            
+            # 4. Metadatos del sistema
+            cursor.execute(_SQL_SYSTEM_METADATA, _EXPLORATION_SUMMARY_KEYS + (_SUMMARY_VALID_KEY,))
+            exploration['system_metadata'] = {
+                row['clave']: {'value': row['valor'], 'date': row['fecha_actualizacion']} 
+                for row in cursor.fetchall()
+            }
         
-        exploration = {}
+        return exploration
+    
+    def _compute_exploration_summary(self, cursor) -> Dict:
+        """
+        Calcula en vivo los principios más comunes, grupos terapéuticos y categorías
         
-        # 1. Principios activos más comunes (ya calculados)
-        cursor.execute('''
-            SELECT principio_activo_normalizado, total_medicamentos 
-            FROM principios_activos 
-            ORDER BY total_medicamentos DESC 
-            LIMIT 10
-        ''')
-        exploration['top_active_ingredients'] = [
-            {'ingredient': row[0], 'count': row[1]} 
-            for row in cursor.fetchall()
-        ]
+        Args:
+            cursor: Cursor sobre la conexión activa
+            
+        Returns:
+            Diccionario con top_active_ingredients, therapeutic_groups y by_category
+        """
+        cursor.execute(_SQL_TOP_INGREDIENTS)
+        summary = {
+            'top_active_ingredients': [
+                {'ingredient': row['principio_activo_normalizado'], 'count': row['total_medicamentos']} 
+                for row in cursor.fetchall()
+            ],
+            'therapeutic_groups': [],
+            'by_category': []
+        }
         
-        # 2. Grupos terapéuticos (con índice)
-        cursor.execute('''
-            SELECT grupo_terapeutico, COUNT(*) as cantidad
-            FROM medicamentos 
-            WHERE grupo_terapeutico != '' 
-            GROUP BY grupo_terapeutico 
-            ORDER BY cantidad DESC
-        ''')
-        exploration['therapeutic_groups'] = [
-            {'group': row[0], 'count': row[1]} 
-            for row in cursor.fetchall()
-        ]
+        # Grupos terapéuticos y distribución por categoría en una sola consulta
+        cursor.execute(_SQL_EXPLORATION_GROUPS)
+        for kind, key, cantidad in cursor.fetchall():
+            if kind == 'g':
+                summary['therapeutic_groups'].append({'group': key, 'count': cantidad})
+            else:
+                summary['by_category'].append({'category': key, 'count': cantidad})
         
-        # 3. Distribución por categoría
-        cursor.execute('''
-            SELECT categoria_medicamento, COUNT(*) as cantidad
-            FROM medicamentos 
-            GROUP BY categoria_medicamento
-        ''')
-        exploration['by_category'] = [
-            {'category': row[0], 'count': row[1]} 
-            for row in cursor.fetchall()
-        ]
+        return summary
+    
+    def _read_exploration_summary(self, cursor) -> Optional[Dict]:
+        """
+        Lee los resúmenes guardados por normalize_database
         
-        # 4. Metadatos del sistema
-        cursor.execute("SELECT clave, valor, fecha_actualizacion FROM metadatos_sistema")
-        exploration['system_metadata'] = {
-            row[0]: {'value': row[1], 'date': row[2]} 
-            for row in cursor.fetchall()
-        }
+        Args:
+            cursor: Cursor sobre la conexión activa
+            
+        Returns:
+            Diccionario como el de _compute_exploration_summary, o None si falta
+            alguno o medicamentos cambió desde la última normalización
+        """
+        try:
+            cursor.execute(_SQL_READ_SUMMARIES, _EXPLORATION_SUMMARY_KEYS + (_SUMMARY_VALID_KEY,))
+            guardados = {clave: json.loads(valor) for clave, valor in cursor.fetchall()}
+        except (sqlite3.OperationalError, TypeError, ValueError) as e:
+            logger.warning(f"Resúmenes de exploración no disponibles: {e}")
+            return None
         
-        if self.db_path:
-            conn.close()
+        if len(guardados) != len(_EXPLORATION_SUMMARY_KEYS) + 1:
+            return None
         
-        return exploration
+        del guardados[_SUMMARY_VALID_KEY]
+        return guardados
     
     def get_optimization_status(self) -> Dict:
         """
@@ -323,56 +696,84 @@ class IMSSOptimizationModule:
         Returns:
             Estado actual de las optimizaciones
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        status = {
-            'tables_created': False,
-            'database_normalized': False,
-            'indexes_created': False,
-            'ready_for_fast_search': False
-        }
-        
-        # Verificar si existen las tablas de optimización
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='principios_activos'")
-        status['tables_created'] = cursor.fetchone() is not None
-        
-        # Verificar si la base está normalizada
-        try:
-            cursor.execute("SELECT valor FROM metadatos_sistema WHERE clave = 'normalizacion_completa'")
-            resultado = cursor.fetchone()
-            status['database_normalized'] = resultado and resultado[0] == 'true'
-        except sqlite3.OperationalError:
-            status['database_normalized'] = False
-        
-        # Verificar índices
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='index' AND name='idx_principio_activo'")
-        status['indexes_created'] = cursor.fetchone() is not None
-        
-        # Sistema listo para búsqueda rápida
-        status['ready_for_fast_search'] = all([
-            status['tables_created'],
-            status['database_normalized'],
-            status['indexes_created']
-        ])
-        
-        if self.db_path:
-            conn.close()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            status = {
+                'tables_created': False,
+                'database_normalized': False,
+                'indexes_created': False,
+                'ready_for_fast_search': False
+            }
+            
+            # Tabla, índice y marca de normalización en una sola consulta
+            try:
+                cursor.execute(_SQL_OPTIMIZATION_STATUS)
+            except sqlite3.OperationalError:
+                # Sin metadatos_sistema la base no está normalizada
+                cursor.execute(_SQL_OPTIMIZATION_STATUS_NO_META)
+            probes = dict(cursor.fetchall())
+            
+            status['tables_created'] = bool(probes['tbl'])
+            status['database_normalized'] = bool(probes.get('norm', 0))
+            status['indexes_created'] = bool(probes['idx'])
+            
+            # Sistema listo para búsqueda rápida
+            status['ready_for_fast_search'] = all([
+                status['tables_created'],
+                status['database_normalized'],
+                status['indexes_created']
+            ])
         
         return status
 
-def initialize_optimization_module(db_connection) -> IMSSOptimizationModule:
+def _normalize_pair(args) -> tuple:
+    """(clave, descripcion, nombre_generico) -> (principio, clave); función de módulo para mp.Pool"""
+    clave, descripcion, nombre_generico = args
+    return IMSSOptimizationModule._normalize_static(descripcion, nombre_generico or ""), clave
+
+def _get_pool(db_key: str) -> queue.LifoQueue:
+    """Obtiene (o crea) el pool de conexiones de una base de datos"""
+    with _POOLS_LOCK:
+        pool = _POOLS.get(db_key)
+        if pool is None:
+            pool = _POOLS[db_key] = queue.LifoQueue(maxsize=_POOL_SIZE)
+        return pool
+
+def _open_connection(db_path: str) -> sqlite3.Connection:
+    """Abre una conexión configurada para el pool"""
+    conn = sqlite3.connect(
+        db_path,
+        check_same_thread=False,
+        isolation_level=None,
+        cached_statements=_STATEMENT_CACHE_SIZE
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(f"PRAGMA {pragma}")
+    _register_functions(conn)
+    return conn
+
+def _register_functions(conn: sqlite3.Connection):
+    """Registra norm_pa en la conexión; deterministic requiere Python 3.8+ y SQLite 3.8.3+"""
+    try:
+        conn.create_function("norm_pa", 2, IMSSOptimizationModule._normalize_static, deterministic=True)
+    except (TypeError, sqlite3.NotSupportedError):
+        conn.create_function("norm_pa", 2, IMSSOptimizationModule._normalize_static)
+
+def initialize_optimization_module(db_connection, use_counts_table: bool = False) -> IMSSOptimizationModule:
     """
     Inicializa el módulo de optimización
     
     Args:
         db_connection: Conexión a la base de datos existente
+        use_counts_table: Ver IMSSOptimizationModule.setup_optimization_tables
         
     Returns:
         Instancia del módulo de optimización configurada
     """
     module = IMSSOptimizationModule(db_connection)
-    module.setup_optimization_tables()
+    module.setup_optimization_tables(use_counts_table)
     return module
 
 # Ejemplo de uso como módulo independiente
@@ -3,70 +3,159 @@ Módulo de Verificación Rápida IMSS
 Solo verifica el estado sin reconstruir datos
 """
 
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Dict, List
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Pool de conexiones por base de datos (clave: ruta absoluta)
+# Las verificaciones repetidas reutilizan la conexión y su page cache
+_POOL_SIZE = 4
+_POOLS: Dict[str, queue.LifoQueue] = {}
+_POOLS_LOCK = threading.Lock()
+
+# sqlite3 reutiliza la sentencia preparada si recibe exactamente el mismo texto SQL
+# (caché LRU por conexión); por eso las consultas se definen una vez aquí
+_STATEMENT_CACHE_SIZE = 256
+
+_SQL_QUICK_STATUS = """
+    SELECT
+        (SELECT COUNT(*) FROM medicamentos),
+        (SELECT COUNT(*) FROM medicamentos
+         WHERE principio_activo_normalizado IS NOT NULL AND principio_activo_normalizado != ''),
+        (SELECT COUNT(*) FROM principios_activos)
+"""
+_SQL_QUICK_COUNT = "SELECT COUNT(*) FROM medicamentos"
+_SQL_HAS_NORMALIZATION_COLUMN = "SELECT name FROM pragma_table_info('medicamentos') WHERE name = 'principio_activo_normalizado'"
+_SQL_NORMALIZED_COUNT = "SELECT COUNT(*) FROM medicamentos WHERE principio_activo_normalizado IS NOT NULL AND principio_activo_normalizado != ''"
+_SQL_HAS_PRINCIPIOS_TABLE = "SELECT name FROM sqlite_master WHERE type='table' AND name = 'principios_activos'"
+_SQL_PRINCIPIOS_COUNT = "SELECT COUNT(*) FROM principios_activos"
+_SQL_TRADITIONAL_SEARCH = "SELECT COUNT(*) FROM medicamentos WHERE descripcion LIKE ?"
+# Prefijo sobre el índice UNIQUE de principios_activos (colación binaria, valores
+# en mayúsculas): GLOB 'TERM*' se resuelve como rango del índice, sin recorrer la tabla
+_SQL_OPTIMIZED_SEARCH = """
+    SELECT COUNT(*) FROM principios_activos 
+    WHERE principio_activo_normalizado GLOB ?
+"""
+_SQL_HAS_FTS = "SELECT 1 FROM sqlite_master WHERE type='table' AND name='principios_activos_fts'"
+_SQL_FTS_SEARCH = """
+    SELECT COUNT(*) FROM principios_activos_fts 
+    WHERE principios_activos_fts MATCH ?
+"""
+_SQL_SAMPLE_NORMALIZATION = """
+    SELECT clave, descripcion, principio_activo_normalizado 
+    FROM medicamentos 
+    WHERE principio_activo_normalizado IS NOT NULL 
+    AND principio_activo_normalizado != ''
+    LIMIT ?
+"""
+
+def _get_pool(db_key: str) -> queue.LifoQueue:
+    """Obtiene (o crea) el pool de conexiones de una base de datos"""
+    with _POOLS_LOCK:
+        pool = _POOLS.get(db_key)
+        if pool is None:
+            pool = _POOLS[db_key] = queue.LifoQueue(maxsize=_POOL_SIZE)
+        return pool
+
 class IMSSQuickChecker:
     """Verificador rápido del estado de la base de datos IMSS"""
     
     def __init__(self, db_path: str = "imss_medicamentos.db"):
         self.db_path = Path(db_path)
         self.exists = self.db_path.exists()
+        self._db_key = str(self.db_path.resolve())
+    
+    @contextmanager
+    def _get_connection(self):
+        """Obtiene una conexión del pool y la devuelve al terminar"""
+        pool = _get_pool(self._db_key)
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(
+                self._db_key,
+                check_same_thread=False,
+                isolation_level=None,
+                cached_statements=_STATEMENT_CACHE_SIZE
+            )
+            conn.row_factory = sqlite3.Row
+        
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
     
     def quick_status(self) -> Dict:
         """Verificación súper rápida del estado general"""
         if not self.exists:
             return {'status': 'no_database', 'message': 'Base de datos no existe'}
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            # Verificaciones básicas rápidas
-            cursor.execute("SELECT COUNT(*) FROM medicamentos")
-            total_meds = cursor.fetchone()[0]
-            
-            # Verificar si tiene normalización
-            cursor.execute("SELECT name FROM pragma_table_info('medicamentos') WHERE name = 'principio_activo_normalizado'")
-            has_normalization_column = cursor.fetchone() is not None
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
             
-            if has_normalization_column:
-                cursor.execute("SELECT COUNT(*) FROM medicamentos WHERE principio_activo_normalizado IS NOT NULL AND principio_activo_normalizado != ''")
-                normalized_count = cursor.fetchone()[0]
+            try:
+                try:
+                    # Todo en una sola consulta; solo compila si existen la
+                    # columna normalizada y la tabla de principios activos
+                    cursor.execute(_SQL_QUICK_STATUS)
+                    total_meds, normalized_count, unique_ingredients = cursor.fetchone()
+                    has_optimization_table = True
+                except sqlite3.OperationalError:
+                    total_meds, normalized_count, unique_ingredients, has_optimization_table = self._quick_status_by_parts(cursor)
+                
                 normalization_percent = (normalized_count / total_meds * 100) if total_meds > 0 else 0
-            else:
-                normalized_count = 0
-                normalization_percent = 0
-            
-            # Verificar tabla de optimización
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name = 'principios_activos'")
-            has_optimization_table = cursor.fetchone() is not None
-            
-            if has_optimization_table:
-                cursor.execute("SELECT COUNT(*) FROM principios_activos")
-                unique_ingredients = cursor.fetchone()[0]
-            else:
-                unique_ingredients = 0
-            
-            conn.close()
-            
-            return {
-                'status': 'ready' if normalization_percent > 90 else 'needs_optimization',
-                'total_medications': total_meds,
-                'normalized_medications': normalized_count,
-                'normalization_percentage': round(normalization_percent, 1),
-                'unique_ingredients': unique_ingredients,
-                'optimization_table_exists': has_optimization_table,
-                'ready_for_use': normalization_percent > 50 and has_optimization_table
-            }
-            
-        except Exception as e:
-            conn.close()
-            return {'status': 'error', 'message': str(e)}
+                
+                return {
+                    'status': 'ready' if normalization_percent > 90 else 'needs_optimization',
+                    'total_medications': total_meds,
+                    'normalized_medications': normalized_count,
+                    'normalization_percentage': round(normalization_percent, 1),
+                    'unique_ingredients': unique_ingredients,
+                    'optimization_table_exists': has_optimization_table,
+                    'ready_for_use': normalization_percent > 50 and has_optimization_table
+                }
+                
+            except Exception as e:
+                return {'status': 'error', 'message': str(e)}
+    
+    def _quick_status_by_parts(self, cursor) -> tuple:
+        """Conteos de quick_status consulta por consulta (base sin optimizar)"""
+        # Verificaciones básicas rápidas
+        cursor.execute(_SQL_QUICK_COUNT)
+        total_meds = cursor.fetchone()[0]
+        
+        # Verificar si tiene normalización
+        cursor.execute(_SQL_HAS_NORMALIZATION_COLUMN)
+        has_normalization_column = cursor.fetchone() is not None
+        
+        if has_normalization_column:
+            cursor.execute(_SQL_NORMALIZED_COUNT)
+            normalized_count = cursor.fetchone()[0]
+        else:
+            normalized_count = 0
+        
+        # Verificar tabla de optimización
+        cursor.execute(_SQL_HAS_PRINCIPIOS_TABLE)
+        has_optimization_table = cursor.fetchone() is not None
+        
+        if has_optimization_table:
+            cursor.execute(_SQL_PRINCIPIOS_COUNT)
+            unique_ingredients = cursor.fetchone()[0]
+        else:
+            unique_ingredients = 0
+        
+        return total_meds, normalized_count, unique_ingredients, has_optimization_table
     
     def test_search_performance(self, test_term: str = "paracetamol") -> Dict:
         """Prueba rápida de rendimiento de búsqueda"""
@@ -74,80 +163,84 @@ class IMSSQuickChecker:
             return {'error': 'No database'}
         
         import time
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            # Búsqueda tradicional
-            start_time = time.time()
-            cursor.execute("SELECT COUNT(*) FROM medicamentos WHERE descripcion LIKE ?", (f'%{test_term}%',))
-            traditional_count = cursor.fetchone()[0]
-            traditional_time = time.time() - start_time
-            
-            # Búsqueda optimizada (si existe)
-            optimized_time = None
-            optimized_count = 0
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
             
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name = 'principios_activos'")
-            if cursor.fetchone():
+            try:
+                # Búsqueda tradicional
                 start_time = time.time()
-                cursor.execute("""
-                    SELECT COUNT(*) FROM principios_activos 
-                    WHERE principio_activo_normalizado LIKE ?
-                """, (f'%{test_term.upper()}%',))
-                optimized_count = cursor.fetchone()[0]
-                optimized_time = time.time() - start_time
-            
-            conn.close()
-            
-            return {
-                'test_term': test_term,
-                'traditional_search': {
-                    'time_seconds': round(traditional_time, 4),
-                    'results_count': traditional_count
-                },
-                'optimized_search': {
-                    'time_seconds': round(optimized_time, 4) if optimized_time else None,
-                    'results_count': optimized_count,
-                    'available': optimized_time is not None
+                cursor.execute(_SQL_TRADITIONAL_SEARCH, (f'%{test_term}%',))
+                traditional_count = cursor.fetchone()[0]
+                traditional_time = time.time() - start_time
+                
+                # Búsqueda optimizada (si existe)
+                optimized_time = None
+                optimized_count = 0
+                
+                cursor.execute(_SQL_HAS_PRINCIPIOS_TABLE)
+                if cursor.fetchone():
+                    start_time = time.time()
+                    cursor.execute(_SQL_OPTIMIZED_SEARCH, (f'{test_term.upper()}*',))
+                    optimized_count = cursor.fetchone()[0]
+                    optimized_time = time.time() - start_time
+                
+                # Búsqueda por subcadena de token con FTS5 (si existe)
+                fts_time = None
+                fts_count = 0
+                
+                cursor.execute(_SQL_HAS_FTS)
+                if cursor.fetchone():
+                    fts_query = '"' + test_term.upper().replace('"', '""') + '"*'
+                    start_time = time.time()
+                    cursor.execute(_SQL_FTS_SEARCH, (fts_query,))
+                    fts_count = cursor.fetchone()[0]
+                    fts_time = time.time() - start_time
+                
+                return {
+                    'test_term': test_term,
+                    'traditional_search': {
+                        'time_seconds': round(traditional_time, 4),
+                        'results_count': traditional_count
+                    },
+                    'optimized_search': {
+                        'time_seconds': round(optimized_time, 4) if optimized_time is not None else None,
+                        'results_count': optimized_count,
+                        'available': optimized_time is not None
+                    },
+                    'fts_search': {
+                        'time_seconds': round(fts_time, 4) if fts_time is not None else None,
+                        'results_count': fts_count,
+                        'available': fts_time is not None
+                    }
                 }
-            }
-            
-        except Exception as e:
-            conn.close()
-            return {'error': str(e)}
+                
+            except Exception as e:
+                return {'error': str(e)}
     
     def sample_normalization(self, limit: int = 5) -> List[Dict]:
         """Muestra una pequeña muestra de normalización"""
         if not self.exists:
             return []
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("""
-                SELECT clave, descripcion, principio_activo_normalizado 
-                FROM medicamentos 
-                WHERE principio_activo_normalizado IS NOT NULL 
-                AND principio_activo_normalizado != ''
-                LIMIT ?
-            """, (limit,))
-            
-            results = []
-            for row in cursor.fetchall():
-                results.append({
-                    'clave': row[0],
-                    'descripcion': row[1][:50] + '...' if len(row[1]) > 50 else row[1],
-                    'principio_normalizado': row[2]
-                })
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
             
-            conn.close()
-            return results
-            
-        except Exception as e:
-            conn.close()
-            return []
+            try:
+                cursor.execute(_SQL_SAMPLE_NORMALIZATION, (limit,))
+                
+                results = []
+                for row in cursor.fetchall():
+                    descripcion = row['descripcion']
+                    results.append({
+                        'clave': row['clave'],
+                        'descripcion': descripcion[:50] + '...' if len(descripcion) > 50 else descripcion,
+                        'principio_normalizado': row['principio_activo_normalizado']
+                    })
+                
+                return results
+                
+            except Exception as e:
+                return []
     
     def suggest_next_steps(self, status: Dict) -> List[str]:
         """Sugiere los próximos pasos basado en el estado"""
@@ -236,6 +329,9 @@ def quick_check(db_path: str = "imss_medicamentos.db") -> None:
             print(f"   Mejora de velocidad: {speedup:.1f}x más rápido" if speedup > 1 else "   Similar velocidad")
         else:
             print("   Búsqueda optimizada: No disponible")
+        fts = perf['fts_search']
+        if fts['available']:
+            print(f"   Búsqueda FTS5: {fts['time_seconds']}s ({fts['results_count']} grupos)")
     
     # Sugerencias
     suggestions = checker.suggest_next_steps(status)
@@ -4,21 +4,204 @@ Retorna solo True/False con códigos de error
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import PyPDF2
 import re
 import json
 import csv
+import functools
+import hashlib
+import mmap
+import multiprocessing as mp
 import sqlite3
+import string
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, asdict
+from operator import attrgetter
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
-import io
 from pathlib import Path
 import logging
 
+from Core.fts_module import ensure_medicamentos_fts
+
 logger = logging.getLogger(__name__)
 
-@dataclass
+# PDFium (C) extrae texto mucho más rápido que PyPDF2; si no está instalado se usa PyPDF2
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    pdfium = None
+    PDFIUM_AVAILABLE = False
+
+# orjson (Rust) serializa la exportación JSON varias veces más rápido que json con indent
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+# PDFium no es seguro entre hilos: los catálogos se procesan en hilos distintos
+_PDFIUM_LOCK = threading.Lock()
+
+# WAL deja leer (search, optimizador) mientras sync_data escribe; NORMAL en WAL
+# solo hace fsync en los checkpoints. Con recursive_triggers el borrado implícito
+# de INSERT OR REPLACE dispara los triggers AFTER DELETE
+_CONNECTION_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-65536",
+    "mmap_size=268435456",
+    "recursive_triggers=ON"
+)
+
+_SQL_HAS_NORMALIZATION_COLUMN = "SELECT name FROM pragma_table_info('medicamentos') WHERE name = 'principio_activo_normalizado'"
+
+_SEARCH_LIMIT = 10
+_SEARCH_CACHE_SIZE = 512
+
+# Clave de la caché de búsquedas: LIKE solo ignora mayúsculas ASCII, así que solo
+# esas se igualan; 'Ó' y 'ó' siguen siendo búsquedas distintas
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+# Búsquedas simples; el texto fijo permite reusar la sentencia preparada del
+# caché de la conexión compartida.
+# Por prefijo: una rama por columna para que cada una busque en su índice NOCASE
+# (con OR el planificador usa un solo índice o recorre la tabla). UNION ALL deja
+# que LIMIT corte sin materializar; la segunda rama excluye lo que ya dio la primera
+_SQL_SEARCH_PREFIX = f'''
+    SELECT clave, descripcion, grupo_terapeutico 
+    FROM medicamentos WHERE descripcion LIKE ?
+    UNION ALL
+    SELECT clave, descripcion, grupo_terapeutico 
+    FROM medicamentos WHERE nombre_generico LIKE ? AND descripcion NOT LIKE ?
+    LIMIT {_SEARCH_LIMIT}
+'''
+
+# Subcadena a mitad de texto: no hay índice que ayude, recorre la tabla
+_SQL_SEARCH_SUBSTRING = f'''
+    SELECT clave, descripcion, grupo_terapeutico 
+    FROM medicamentos WHERE 
+    descripcion LIKE ? OR nombre_generico LIKE ? 
+    LIMIT {_SEARCH_LIMIT}
+'''
+
+# Índices secundarios de medicamentos (nombre, columna). Los de texto son NOCASE
+# porque LIKE no distingue mayúsculas y solo así puede buscar un prefijo en el índice;
+# los nombres coinciden con los del módulo de optimización (búsquedas sin FTS5)
+_INDEXES = (
+    ('idx_clave_norm', 'clave_normalizada'),
+    ('idx_med_desc_nocase', 'descripcion COLLATE NOCASE'),
+    ('idx_med_generico_nocase', 'nombre_generico COLLATE NOCASE'),
+    ('idx_grupo', 'grupo_terapeutico')
+)
+
+# Índice binario de versiones anteriores, que LIKE no puede aprovechar
+_OBSOLETE_INDEXES = ('idx_descripcion',)
+
+# A partir de este tamaño de lote conviene borrar los índices y recrearlos al final
+_INDEX_REBUILD_MIN_ROWS = 1000
+
+
+# Prefijo de token en descripcion o nombre_generico, vía el índice invertido
+_SQL_SEARCH_FTS = f'''
+    SELECT m.clave, m.descripcion, m.grupo_terapeutico 
+    FROM medicamentos_fts f
+    JOIN medicamentos m ON m.rowid = f.rowid
+    WHERE medicamentos_fts MATCH ?
+    LIMIT {_SEARCH_LIMIT}
+'''
+
+# Patrones de parseo de los catálogos, compilados una sola vez
+_RE_CLAVE = re.compile(r'(\d{3}\.\d{3}\.\d{4}\.\d{2})')
+_RE_CATALOG_II = re.compile(r'(\d{3}\.\d{3}\.\d{4}\.\d{2})\s+([A-Z][A-Z\s\-]+)')
+_RE_WS = re.compile(r'\s+')
+_RE_DESCRIPCION = re.compile(r'([^\.]+(?:mg|g|ml|UI|mcg|μg)[^\.]*)')
+
+# Grupo terapéutico por prefijo de clave (los tres primeros dígitos)
+_THERAPEUTIC_GROUPS = {'010': 'Analgesia', '040': 'Anestesia', '020': 'Cardiología'}
+_GROUP_DEFAULT = 'No clasificado'
+
+# Presentaciones en orden de prioridad (gana la primera de la lista que aparezca),
+# con su forma de salida ya calculada
+_PRESENTACIONES = tuple(
+    (presentacion, presentacion.title())
+    for presentacion in ('tableta', 'ampolleta', 'cápsula', 'solución')
+)
+
+# Extracción de texto en paralelo: solo compensa arrancar procesos en PDFs grandes
+_PARALLEL_MIN_PAGES = 32
+
+# Búfer de escritura de la exportación CSV
+_EXPORT_BUFFER_SIZE = 1 << 20
+
+# Las descargas se escriben a disco por bloques en lugar de quedar completas en memoria
+_DOWNLOAD_CHUNK_SIZE = 1 << 16
+
+# Validadores HTTP de la última descarga sincronizada de cada catálogo, para
+# pedirlos con GET condicional y no volver a parsear un PDF que no cambió
+_SQL_CREATE_SYNC_META = '''
+    CREATE TABLE IF NOT EXISTS sync_meta (
+        url TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        sha256 TEXT,
+        fecha_actualizacion TEXT
+    )
+'''
+_SQL_READ_SYNC_META = "SELECT etag, last_modified, sha256 FROM sync_meta WHERE url = ?"
+_SQL_SAVE_SYNC_META = '''
+    INSERT OR REPLACE INTO sync_meta (url, etag, last_modified, sha256, fecha_actualizacion)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+# _download_pdf devuelve esto cuando el catálogo no cambió desde la última sincronización
+_NOT_MODIFIED = 'NOT_MODIFIED'
+
+def _count_pages(pdf_path: str) -> int:
+    """Número de páginas del PDF"""
+    if PDFIUM_AVAILABLE:
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(pdf_path)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+    
+    with open(pdf_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as datos:
+        return len(PyPDF2.PdfReader(datos).pages)
+
+def _extract_pages(pdf_path: str, start: int, stop: int) -> str:
+    """Extrae el texto de las páginas [start, stop) (función de módulo para poder enviarla a otro proceso)"""
+    if PDFIUM_AVAILABLE:
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(pdf_path)
+            try:
+                return "\n".join(pdf[i].get_textpage().get_text_range() for i in range(start, stop))
+            finally:
+                pdf.close()
+    
+    # mmap: PyPDF2 lee del archivo mapeado en lugar de una copia completa en memoria
+    with open(pdf_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as datos:
+        pdf_reader = PyPDF2.PdfReader(datos)
+        return "\n".join(pdf_reader.pages[i].extract_text() for i in range(start, stop))
+
+def _dump_json_row(row: Dict) -> bytes:
+    """Serializa una fila de la exportación JSON con indentación de 2 espacios"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(row, option=orjson.OPT_INDENT_2)
+    return json.dumps(row, ensure_ascii=False, indent=2).encode('utf-8')
+
+def _fts_query(term: str) -> str:
+    """Convierte un término libre en una consulta FTS5 de prefijo sobre descripcion y nombre_generico"""
+    return '{descripcion nombre_generico} : "' + term.replace('"', '""') + '"*'
+
+@dataclass(slots=True)
 class MedicamentoIMSS:
     """Estructura de datos para un medicamento del IMSS"""
     # Identificadores
@@ -83,9 +266,35 @@ class IMSSModule:
         sample_med = MedicamentoIMSS(clave="000.000.0000.00")
         self.field_names = list(sample_med.to_dict().keys())
         self.field_count = len(self.field_names)
+        # Fila para INSERT en el orden de las columnas, sin pasar por asdict
+        self._row_getter = attrgetter(*self.field_names)
+        
+        # UPSERT por clave: una clave existente se actualiza en su sitio (mismo rowid),
+        # sin el borrado y reinserción de INSERT OR REPLACE en cada índice
+        self._upsert_sql = (
+            f"INSERT INTO medicamentos ({', '.join(self.field_names)}) "
+            f"VALUES ({', '.join('?' for _ in self.field_names)}) "
+            f"ON CONFLICT(clave) DO UPDATE SET "
+            + ', '.join(f"{campo} = excluded.{campo}" for campo in self.field_names if campo != 'clave')
+        )
         
         self.last_error = ""
         self.last_stats = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._has_fts = False
+        self._has_normalization = False
+        
+        # Cachés de lectura; se invalidan cada vez que el módulo escribe en la base
+        self._search_cached = functools.lru_cache(maxsize=_SEARCH_CACHE_SIZE)(self._search_rows)
+        self._stats_cache: Optional[Dict] = None
+        
+        # Sesión HTTP con conexiones persistentes (una por catálogo en paralelo)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        # Validadores descargados; se guardan en sync_meta solo si la sincronización termina bien
+        self._pending_sync_meta: Dict[str, Tuple] = {}
     
     def initialize(self) -> Tuple[bool, str]:
         """
@@ -111,15 +320,16 @@ class IMSSModule:
             logger.info("Iniciando sincronización IMSS...")
             
             # Procesar PDFs
+            self._pending_sync_meta = {}
             medicamentos = self._process_all_catalogs()
+            if medicamentos is None:
+                logger.info("IMSS sin cambios desde la última sincronización")
+                return True, "IMSS_SYNC_NOOP"
             if not medicamentos:
                 return False, "IMSS_NO_DATA_FOUND"
             
-            # Almacenar en base de datos
-            success_count = 0
-            for medicamento in medicamentos:
-                if self._add_medication(medicamento):
-                    success_count += 1
+            # Almacenar en base de datos (una sola transacción)
+            success_count = self._add_medications_bulk(medicamentos)
             
             # Configurar optimizaciones
             opt_success = self._setup_optimizations()
@@ -135,6 +345,8 @@ class IMSSModule:
             if success_count == 0:
                 return False, "IMSS_NO_MEDICATIONS_SAVED"
             
+            self._save_sync_meta()
+            
             logger.info(f"IMSS sincronización completada: {success_count}/{len(medicamentos)}")
             return True, "IMSS_SYNC_SUCCESS"
             
@@ -152,30 +364,28 @@ class IMSSModule:
             if not self.db_path.exists():
                 return False, "IMSS_NO_DATABASE"
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            cursor = self._get_connection().cursor()
             
             # Verificar que tiene datos
             cursor.execute("SELECT COUNT(*) FROM medicamentos")
             total_meds = cursor.fetchone()[0]
             
             if total_meds == 0:
-                conn.close()
                 return False, "IMSS_EMPTY_DATABASE"
             
-            # Verificar normalización
-            cursor.execute("SELECT name FROM pragma_table_info('medicamentos') WHERE name = 'principio_activo_normalizado'")
-            has_normalization = cursor.fetchone() is not None
+            # Verificar normalización; la columna no desaparece una vez creada, así que
+            # solo se consulta el esquema mientras no se haya visto
+            if not self._has_normalization:
+                cursor.execute(_SQL_HAS_NORMALIZATION_COLUMN)
+                self._has_normalization = cursor.fetchone() is not None
             
-            if has_normalization:
+            if self._has_normalization:
                 cursor.execute("SELECT COUNT(*) FROM medicamentos WHERE principio_activo_normalizado IS NOT NULL AND principio_activo_normalizado != ''")
                 normalized_count = cursor.fetchone()[0]
                 normalization_percent = (normalized_count / total_meds * 100) if total_meds > 0 else 0
             else:
                 normalization_percent = 0
             
-            conn.close()
-            
             if normalization_percent > 50:
                 return True, "IMSS_READY"
             else:
@@ -188,27 +398,28 @@ class IMSSModule:
     def get_stats(self) -> Dict:
         """Obtiene estadísticas del módulo"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT COUNT(*) FROM medicamentos")
-            total = cursor.fetchone()[0]
-            
-            cursor.execute('''
-                SELECT grupo_terapeutico, COUNT(*) 
-                FROM medicamentos 
-                WHERE grupo_terapeutico IS NOT NULL AND grupo_terapeutico != ''
-                GROUP BY grupo_terapeutico 
-                ORDER BY COUNT(*) DESC LIMIT 5
-            ''')
-            top_groups = dict(cursor.fetchall())
-            
-            conn.close()
+            if self._stats_cache is None:
+                cursor = self._get_connection().cursor()
+                
+                cursor.execute("SELECT COUNT(*) FROM medicamentos")
+                total = cursor.fetchone()[0]
+                
+                cursor.execute('''
+                    SELECT grupo_terapeutico, COUNT(*) 
+                    FROM medicamentos 
+                    WHERE grupo_terapeutico IS NOT NULL AND grupo_terapeutico != ''
+                    GROUP BY grupo_terapeutico 
+                    ORDER BY COUNT(*) DESC LIMIT 5
+                ''')
+                self._stats_cache = {
+                    'total_medications': total,
+                    'top_therapeutic_groups': dict(cursor.fetchall())
+                }
             
             return {
                 'institution': 'IMSS',
-                'total_medications': total,
-                'top_therapeutic_groups': top_groups,
+                'total_medications': self._stats_cache['total_medications'],
+                'top_therapeutic_groups': dict(self._stats_cache['top_therapeutic_groups']),
                 'database_file': str(self.db_path),
                 'last_sync_stats': self.last_stats
             }
@@ -219,27 +430,12 @@ class IMSSModule:
     def search(self, term: str) -> List[Dict]:
         """Búsqueda simple de medicamentos"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT clave, descripcion, grupo_terapeutico 
-                FROM medicamentos WHERE 
-                descripcion LIKE ? OR nombre_generico LIKE ? 
-                LIMIT 10
-            ''', (f'%{term}%', f'%{term}%'))
-            
-            results = []
-            for row in cursor.fetchall():
-                results.append({
-                    'clave': row[0],
-                    'descripcion': row[1],
-                    'grupo': row[2]
-                })
-            
-            conn.close()
-            return results
-            
+            # Término sin espacios y con mayúsculas ASCII igualadas: da las mismas filas
+            # que el original y sirve de clave de caché; uno en blanco se busca tal cual
+            return [
+                {'clave': clave, 'descripcion': descripcion, 'grupo': grupo}
+                for clave, descripcion, grupo in self._search_cached(term.strip().translate(_ASCII_LOWER) or term)
+            ]
         except Exception as e:
             return []
     
@@ -252,22 +448,27 @@ class IMSSModule:
         try:
             filename = f"imss_medicamentos.{format}"
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            # El cursor se recorre fila por fila: la tabla nunca se carga completa en memoria
+            cursor = self._get_connection().cursor()
             cursor.execute("SELECT * FROM medicamentos")
-            datos = cursor.fetchall()
-            conn.close()
             
             if format.lower() == 'json':
-                medicamentos_json = [dict(zip(self.field_names, row)) for row in datos]
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(medicamentos_json, f, ensure_ascii=False, indent=2)
+                # Mismo formato que json.dump(lista, indent=2), escrito elemento por elemento
+                with open(filename, 'wb', buffering=_EXPORT_BUFFER_SIZE) as f:
+                    f.write(b"[")
+                    separador = b"\n  "
+                    for row in cursor:
+                        f.write(separador)
+                        f.write(_dump_json_row(dict(zip(self.field_names, row))).replace(b"\n", b"\n  "))
+                        separador = b",\n  "
+                    # Sin filas queda "[]", como json.dump([])
+                    f.write(b"]" if separador == b"\n  " else b"\n]")
             
             elif format.lower() == 'csv':
-                with open(filename, 'w', newline='', encoding='utf-8') as f:
+                with open(filename, 'w', newline='', encoding='utf-8', buffering=_EXPORT_BUFFER_SIZE) as f:
                     writer = csv.writer(f)
                     writer.writerow(self.field_names)
-                    writer.writerows(datos)
+                    writer.writerows(cursor)
             
             return True, filename
             
@@ -278,10 +479,58 @@ class IMSSModule:
         """Obtiene el último error ocurrido"""
         return self.last_error
     
+    def close(self):
+        """Cierra la conexión compartida a la base de datos"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._session.close()
+    
     # Métodos privados (implementación interna)
+    def _get_connection(self) -> sqlite3.Connection:
+        """Conexión compartida del módulo, creada en el primer uso"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            for pragma in _CONNECTION_PRAGMAS:
+                conn.execute(f"PRAGMA {pragma}")
+            self._conn = conn
+        return self._conn
+    
+    def _search_rows(self, term: str) -> Tuple[Tuple, ...]:
+        """Ejecuta la búsqueda; devuelve una tupla de filas para poder cachearla"""
+        cursor = self._get_connection().cursor()
+        
+        rows = []
+        if self._has_fts and term.strip():
+            cursor.execute(_SQL_SEARCH_FTS, (_fts_query(term),))
+            rows = cursor.fetchall()
+        
+        # Prefijo de columna: búsqueda en los índices, sin recorrer la tabla
+        if len(rows) < _SEARCH_LIMIT:
+            patron = f'{term}%'
+            self._extend_rows(rows, cursor.execute(_SQL_SEARCH_PREFIX, (patron, patron, patron)))
+        
+        # Subcadenas a mitad de palabra: el recorrido con LIKE solo si lo anterior no llenó el límite
+        if len(rows) < _SEARCH_LIMIT:
+            patron = f'%{term}%'
+            self._extend_rows(rows, cursor.execute(_SQL_SEARCH_SUBSTRING, (patron, patron)))
+        
+        return tuple(rows[:_SEARCH_LIMIT])
+    
+    @staticmethod
+    def _extend_rows(rows: List[Tuple], nuevas):
+        """Agrega a rows las filas cuya clave aún no aparece"""
+        encontradas = {row[0] for row in rows}
+        rows.extend(row for row in nuevas if row[0] not in encontradas)
+    
+    def _invalidate_caches(self):
+        """Descarta búsquedas y estadísticas cacheadas tras escribir en la base"""
+        self._search_cached.cache_clear()
+        self._stats_cache = None
+    
     def _init_database(self):
         """Inicializa base de datos"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._get_connection()
         cursor = conn.cursor()
         
         # Crear tabla
@@ -301,17 +550,41 @@ class IMSSModule:
         cursor.execute(create_table_sql)
         
         # Índices básicos
-        indices = [
-            'CREATE INDEX IF NOT EXISTS idx_clave_norm ON medicamentos(clave_normalizada)',
-            'CREATE INDEX IF NOT EXISTS idx_descripcion ON medicamentos(descripcion)',
-            'CREATE INDEX IF NOT EXISTS idx_grupo ON medicamentos(grupo_terapeutico)'
-        ]
+        self._create_indexes(conn)
         
-        for indice in indices:
-            cursor.execute(indice)
+        for indice in _OBSOLETE_INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {indice}")
+        
+        cursor.execute(_SQL_CREATE_SYNC_META)
         
         conn.commit()
-        conn.close()
+        
+        # Una base creada por una versión anterior puede no tener aún la columna
+        cursor.execute(_SQL_HAS_NORMALIZATION_COLUMN)
+        self._has_normalization = cursor.fetchone() is not None
+        
+        self._init_fts(conn)
+        self._invalidate_caches()
+    
+    def _create_indexes(self, conn: sqlite3.Connection):
+        """Crea los índices secundarios de medicamentos (la clave primaria no se toca)"""
+        for nombre, columna in _INDEXES:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {nombre} ON medicamentos({columna})')
+    
+    def _drop_indexes(self, conn: sqlite3.Connection):
+        """Elimina los índices secundarios antes de una carga masiva"""
+        for nombre, _ in _INDEXES:
+            conn.execute(f'DROP INDEX IF EXISTS {nombre}')
+    
+    def _init_fts(self, conn: sqlite3.Connection):
+        """Crea medicamentos_fts y sus triggers; lo llena si la tabla es nueva"""
+        try:
+            ensure_medicamentos_fts(conn)
+            self._has_fts = True
+        except sqlite3.Error as e:
+            # SQLite sin FTS5: search se queda con LIKE
+            logger.warning(f"No se pudo crear el índice de texto completo: {e}")
+            self._has_fts = False
     
     def _init_optimizer(self):
         """Inicializa módulo de optimización"""
@@ -322,28 +595,100 @@ class IMSSModule:
         except ImportError:
             self.optimizer = None
     
-    def _download_pdf(self, url: str) -> Optional[bytes]:
-        """Descarga PDF"""
+    def _download_pdf(self, url: str, conditional: bool = True):
+        """
+        Descarga PDF a un archivo temporal (el llamador lo borra)
+        
+        Args:
+            url: URL del catálogo
+            conditional: Si es True, pide el PDF con los validadores de la última
+                sincronización y compara su SHA-256
+            
+        Returns:
+            Ruta del archivo, _NOT_MODIFIED si el catálogo no cambió, o None si falló
+        """
+        destino = None
         try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            return response.content
+            anterior = self._read_sync_meta(url) if conditional else None
+            headers = {}
+            if anterior:
+                etag, last_modified, _ = anterior
+                if etag:
+                    headers['If-None-Match'] = etag
+                if last_modified:
+                    headers['If-Modified-Since'] = last_modified
+            
+            with self._session.get(url, timeout=30, stream=True, headers=headers) as response:
+                if response.status_code == 304:
+                    return _NOT_MODIFIED
+                response.raise_for_status()
+                
+                digest = hashlib.sha256()
+                with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+                    destino = Path(f.name)
+                    for bloque in response.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE):
+                        f.write(bloque)
+                        digest.update(bloque)
+                
+                sha256 = digest.hexdigest()
+                self._pending_sync_meta[url] = (
+                    response.headers.get('ETag'), response.headers.get('Last-Modified'), sha256
+                )
+            
+            # Servidor sin validadores: mismo contenido que la última vez
+            if anterior and anterior[2] == sha256:
+                destino.unlink(missing_ok=True)
+                return _NOT_MODIFIED
+            return destino
         except:
+            if destino is not None:
+                destino.unlink(missing_ok=True)
             return None
     
-    def _extract_pdf_text(self, pdf_content: bytes) -> str:
+    def _read_sync_meta(self, url: str) -> Optional[Tuple]:
+        """Validadores (etag, last_modified, sha256) de la última sincronización del catálogo"""
+        try:
+            return self._get_connection().execute(_SQL_READ_SYNC_META, (url,)).fetchone()
+        except sqlite3.Error:
+            return None
+    
+    def _save_sync_meta(self):
+        """Guarda los validadores de los catálogos descargados en esta sincronización"""
+        fecha = datetime.now().isoformat()
+        conn = self._get_connection()
+        with conn:
+            conn.executemany(_SQL_SAVE_SYNC_META, [
+                (url, etag, last_modified, sha256, fecha)
+                for url, (etag, last_modified, sha256) in self._pending_sync_meta.items()
+            ])
+        self._pending_sync_meta = {}
+    
+    def _extract_pdf_text(self, pdf_path: Path) -> str:
         """Extrae texto de PDF"""
         try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-            return "\n".join(page.extract_text() for page in pdf_reader.pages)
+            pdf_path = str(pdf_path)
+            total_paginas = _count_pages(pdf_path)
+            procesos = min(mp.cpu_count(), total_paginas // _PARALLEL_MIN_PAGES)
+            if procesos < 2:
+                return _extract_pages(pdf_path, 0, total_paginas)
+            
+            # Un rango contiguo de páginas por proceso: cada uno abre el PDF una sola vez.
+            # 'spawn' porque esto corre en un hilo de _process_all_catalogs y fork
+            # desde un proceso con hilos puede heredar locks tomados
+            limites = [total_paginas * i // procesos for i in range(procesos + 1)]
+            with ProcessPoolExecutor(max_workers=procesos, mp_context=mp.get_context('spawn')) as executor:
+                partes = executor.map(
+                    _extract_pages,
+                    [pdf_path] * procesos, limites[:-1], limites[1:]
+                )
+                return "\n".join(partes)
         except:
             return ""
     
     def _parse_main_catalog(self, text: str) -> List[MedicamentoIMSS]:
         """Parsea catálogo principal"""
         medicamentos = []
-        patron_clave = r'(\d{3}\.\d{3}\.\d{4}\.\d{2})'
-        secciones = re.split(patron_clave, text)
+        secciones = _RE_CLAVE.split(text)
         
         for i in range(1, len(secciones), 2):
             if i + 1 < len(secciones):
@@ -358,9 +703,8 @@ class IMSSModule:
     def _parse_catalog_ii(self, text: str) -> List[MedicamentoIMSS]:
         """Parsea catálogo II"""
         medicamentos = []
-        patron = r'(\d{3}\.\d{3}\.\d{4}\.\d{2})\s+([A-Z][A-Z\s\-]+)'
         
-        for clave, nombre in re.findall(patron, text):
+        for clave, nombre in _RE_CATALOG_II.findall(text):
             medicamento = MedicamentoIMSS(
                 clave=clave.strip(),
                 descripcion=nombre.strip(),
@@ -375,10 +719,10 @@ class IMSSModule:
     def _parse_detailed_medication(self, clave: str, contenido: str) -> Optional[MedicamentoIMSS]:
         """Parsea medicamento individual"""
         try:
-            contenido = re.sub(r'\s+', ' ', contenido).strip()
+            contenido = _RE_WS.sub(' ', contenido).strip()
             
             # Extracciones básicas
-            descripcion_match = re.search(r'^([^\.]+(?:mg|g|ml|UI|mcg|μg)[^\.]*)', contenido)
+            descripcion_match = _RE_DESCRIPCION.match(contenido)
             descripcion = descripcion_match.group(1) if descripcion_match else ""
             
             return MedicamentoIMSS(
@@ -402,53 +746,128 @@ class IMSSModule:
     
     def _extract_presentation(self, descripcion: str) -> str:
         """Extrae presentación"""
-        presentaciones = ['tableta', 'ampolleta', 'cápsula', 'solución']
-        for presentacion in presentaciones:
-            if presentacion in descripcion.lower():
-                return presentacion.title()
+        descripcion = descripcion.lower()
+        for presentacion, titulo in _PRESENTACIONES:
+            if presentacion in descripcion:
+                return titulo
         return ""
     
     def _determine_therapeutic_group(self, clave: str) -> str:
         """Determina grupo terapéutico"""
-        grupos = {'010': 'Analgesia', '040': 'Anestesia', '020': 'Cardiología'}
-        return grupos.get(clave[:3], 'No clasificado')
+        return _THERAPEUTIC_GROUPS.get(clave[:3], _GROUP_DEFAULT)
     
-    def _process_all_catalogs(self) -> List[MedicamentoIMSS]:
-        """Procesa todos los catálogos"""
-        todos_medicamentos = []
+    def _process_all_catalogs(self) -> Optional[List[MedicamentoIMSS]]:
+        """
+        Procesa todos los catálogos (descargas y parseo en paralelo)
         
-        # Catálogo principal
-        pdf_principal = self._download_pdf(self.urls['catalogo_principal'])
-        if pdf_principal:
-            texto = self._extract_pdf_text(pdf_principal)
-            medicamentos = self._parse_main_catalog(texto)
-            todos_medicamentos.extend(medicamentos)
+        Returns:
+            Medicamentos deduplicados por clave, o None si ningún catálogo cambió
+        """
+        parsers = {
+            'catalogo_principal': self._parse_main_catalog,
+            'catalogo_ii': self._parse_catalog_ii
+        }
         
-        # Catálogo II
-        pdf_ii = self._download_pdf(self.urls['catalogo_ii'])
-        if pdf_ii:
-            texto = self._extract_pdf_text(pdf_ii)
-            medicamentos = self._parse_catalog_ii(texto)
-            todos_medicamentos.extend(medicamentos)
+        with ThreadPoolExecutor(max_workers=len(parsers)) as executor:
+            futuros = {
+                catalogo: executor.submit(self._process_catalog, self.urls[catalogo], parser)
+                for catalogo, parser in parsers.items()
+            }
+            resultados = {catalogo: futuro.result() for catalogo, futuro in futuros.items()}
+            
+            sin_cambios = [catalogo for catalogo, resultado in resultados.items() if resultado is None]
+            if len(sin_cambios) == len(parsers):
+                return None
+            
+            # Si solo cambió una parte, los demás se vuelven a procesar completos para
+            # conservar la precedencia entre catálogos en las claves repetidas
+            futuros = {
+                catalogo: executor.submit(self._process_catalog, self.urls[catalogo], parsers[catalogo], False)
+                for catalogo in sin_cambios
+            }
+            for catalogo, futuro in futuros.items():
+                resultados[catalogo] = futuro.result()
         
-        return todos_medicamentos
+        # Se recorre en el orden de los catálogos y se deduplica por clave: gana la
+        # última aparición, lo mismo que dejaría el UPSERT, sin escribirla dos veces
+        por_clave = {}
+        for catalogo in parsers:
+            for medicamento in resultados[catalogo] or []:
+                por_clave[medicamento.clave] = medicamento
+        
+        return list(por_clave.values())
+    
+    def _process_catalog(self, url: str, parser, conditional: bool = True) -> Optional[List[MedicamentoIMSS]]:
+        """Descarga, extrae y parsea un catálogo; None si no cambió desde la última sincronización"""
+        pdf_path = self._download_pdf(url, conditional)
+        if pdf_path is _NOT_MODIFIED:
+            return None
+        if pdf_path is None:
+            return []
+        try:
+            texto = self._extract_pdf_text(pdf_path)
+        finally:
+            pdf_path.unlink(missing_ok=True)
+        return parser(texto)
     
     def _add_medication(self, medicamento: MedicamentoIMSS) -> bool:
         """Agrega medicamento a la base"""
+        conn = self._get_connection()
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            placeholders = ', '.join(['?' for _ in range(self.field_count)])
-            valores = tuple(medicamento.to_dict().values())
-            
-            cursor.execute(f'INSERT OR REPLACE INTO medicamentos VALUES ({placeholders})', valores)
-            conn.commit()
-            conn.close()
+            with conn:
+                conn.execute(self._upsert_sql, self._row_getter(medicamento))
+            self._invalidate_caches()
             return True
         except:
             return False
     
+    def _add_medications_bulk(self, medicamentos: List[MedicamentoIMSS]) -> int:
+        """
+        Agrega medicamentos a la base en una sola transacción
+        
+        Args:
+            medicamentos: Medicamentos a insertar o reemplazar
+            
+        Returns:
+            Número de medicamentos guardados
+        """
+        filas = list(map(self._row_getter, medicamentos))
+        reconstruir_indices = len(filas) >= _INDEX_REBUILD_MIN_ROWS
+        
+        conn = self._get_connection()
+        try:
+            with conn:
+                # Carga grande: los índices se reconstruyen al final con un solo
+                # ordenamiento por índice, en vez de insertar fila por fila en cada
+                # B-tree. Todo en la misma transacción: si falla, vuelven intactos
+                conn.execute("BEGIN")
+                if reconstruir_indices:
+                    self._drop_indexes(conn)
+                conn.executemany(self._upsert_sql, filas)
+                if reconstruir_indices:
+                    self._create_indexes(conn)
+            self._invalidate_caches()
+            guardados = len(filas)
+        except Exception as e:
+            # Rollback hecho por el context manager; se reintenta fila por fila
+            # para conservar los que sí se pueden guardar
+            logger.warning(f"Inserción masiva fallida, reintentando por fila: {e}")
+            guardados = sum(1 for medicamento in medicamentos if self._add_medication(medicamento))
+        
+        if guardados:
+            self._analyze(conn)
+        return guardados
+    
+    def _analyze(self, conn: sqlite3.Connection):
+        """
+        Actualiza sqlite_stat1 tras una carga: estadísticas para el planificador
+        (también de los índices recién recreados) y conteos que lee el inspector
+        """
+        try:
+            conn.execute("ANALYZE")
+        except sqlite3.Error as e:
+            logger.warning(f"No se pudieron actualizar estadísticas (ANALYZE): {e}")
+    
     def _setup_optimizations(self) -> bool:
         """Configura optimizaciones"""
         if self.optimizer:
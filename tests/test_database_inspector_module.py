@@ -0,0 +1,152 @@
+"""
+Pruebas del inspector de base de datos
+"""
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from Core import database_inspector_module, optimization_module
+from Core.database_inspector_module import IMSSDatabaseInspector
+from Core.optimization_module import initialize_optimization_module
+from Modules.imss_clean_module import IMSSModule, MedicamentoIMSS
+
+
+class InspectorTestCase(unittest.TestCase):
+    """Inspector sobre una base IMSS optimizada con 100 medicamentos, 30 normalizados"""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = str(Path(self.tmpdir) / 'imss_medicamentos.db')
+        
+        self.modulo = IMSSModule(self.db_path)
+        self.modulo._init_database()
+        self.modulo._add_medications_bulk([
+            MedicamentoIMSS(
+                clave=f'010.000.{i:04d}.00',
+                descripcion=f'Clorhidrato de metformina {i} mg tableta',
+                principio_activo_normalizado='METFORMINA' if i < 30 else ''
+            )
+            for i in range(100)
+        ])
+        initialize_optimization_module(self.db_path)
+    
+    def tearDown(self):
+        self.modulo.close()
+        db_key = str(Path(self.db_path).resolve())
+        for pools in (database_inspector_module._POOLS, optimization_module._POOLS):
+            pool = pools.pop(db_key, None)
+            while pool is not None and not pool.empty():
+                pool.get_nowait().close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+    
+    def inspector(self) -> IMSSDatabaseInspector:
+        return IMSSDatabaseInspector(self.db_path)
+    
+    def analyze(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("ANALYZE")
+        finally:
+            conn.close()
+    
+    def schema_version(self) -> int:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute("PRAGMA schema_version").fetchone()[0]
+        finally:
+            conn.close()
+
+
+class ReadOnlyTest(InspectorTestCase):
+    
+    def test_inspector_does_not_change_schema(self):
+        """Abrir el inspector no crea índices, FTS, _counts ni estadísticas"""
+        antes = self.schema_version()
+        inspector = self.inspector()
+        inspector.get_inspection_report()
+        self.assertEqual(self.schema_version(), antes)
+    
+    def test_uses_objects_created_by_the_optimizer(self):
+        initialize_optimization_module(self.db_path, use_counts_table=True)
+        inspector = self.inspector()
+        self.assertTrue(inspector._has_fts)
+        self.assertTrue(inspector._has_counts)
+        
+        status = inspector.check_normalization_status()
+        self.assertEqual(status['medicamentos_normalized'], 30)
+        self.assertEqual(status['medicamentos_without_normalization'], 70)
+
+
+class RowCountTest(InspectorTestCase):
+    
+    def medicamentos_row_count(self, inspector: IMSSDatabaseInspector):
+        tabla = inspector.get_database_structure()['tables']['medicamentos']
+        return tabla['row_count'], tabla['row_count_is_estimate']
+    
+    def test_partial_index_stats_are_not_row_counts(self):
+        inspector = self.inspector()
+        self.analyze()
+        
+        conn = sqlite3.connect(self.db_path)
+        try:
+            parciales = conn.execute(
+                "SELECT stat FROM sqlite_stat1 WHERE idx = 'idx_med_norm_null'"
+            ).fetchone()
+        finally:
+            conn.close()
+        self.assertEqual(parciales[0].split()[0], '70')
+        
+        self.assertEqual(self.medicamentos_row_count(inspector), (100, True))
+    
+    def test_estimate_follows_a_later_sync(self):
+        inspector = self.inspector()
+        self.assertEqual(self.medicamentos_row_count(inspector)[0], 100)
+        
+        self.modulo._add_medications_bulk([
+            MedicamentoIMSS(clave='020.000.0001.00', descripcion='Paracetamol 500 mg tableta')
+        ])
+        self.assertEqual(self.medicamentos_row_count(inspector), (101, True))
+
+
+
+class SearchTest(InspectorTestCase):
+    
+    def setUp(self):
+        super().setUp()
+        self.modulo._add_medications_bulk([
+            MedicamentoIMSS(clave='010.000.0104.00', descripcion='PARACETAMOL 500 MG TABLETA',
+                            nombre_generico='PARACETAMOL', principio_activo_normalizado='PARACETAMOL'),
+            MedicamentoIMSS(clave='010.000.0106.00', descripcion='Tabletas de paracetamol 750 mg',
+                            principio_activo_normalizado='PARACETAMOL'),
+            MedicamentoIMSS(clave='010.000.2520.00', descripcion='LOSARTÁN POTÁSICO 50 MG',
+                            principio_activo_normalizado='LOSARTAN'),
+            MedicamentoIMSS(clave='010.000.3407.00', descripcion='NAPROXENO 250 MG',
+                            nombre_generico='naproxeno sódico', principio_activo_normalizado='NAPROXENO'),
+            MedicamentoIMSS(clave='010.000.5040.00', descripcion='IBUPROFENO 400 MG')
+        ])
+    
+    def examples(self, inspector: IMSSDatabaseInspector, term: str):
+        examples = inspector.find_normalization_examples(term)
+        return sorted((e['clave'], e['normalized_ingredient']) for e in examples)
+    
+    def test_fts_matches_like(self):
+        """Para términos que empiezan palabra, FTS5 y LIKE devuelven los mismos ejemplos"""
+        inspector = self.inspector()
+        self.assertTrue(inspector._has_fts)
+        
+        for term in ('paracetamol', 'Parac', 'losartan', 'NAPROX', 'sódico', 'ibuprofeno'):
+            with self.subTest(term=term):
+                inspector._has_fts = True
+                fts = self.examples(inspector, term)
+                inspector._has_fts = False
+                self.assertEqual(fts, self.examples(inspector, term))
+        
+        inspector._has_fts = True
+        self.assertEqual(len(self.examples(inspector, 'paracetamol')), 2)
+        self.assertEqual(self.examples(inspector, 'ibuprofeno'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+"""
+Pruebas del módulo IMSS
+"""
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from Core import optimization_module
+from Core.optimization_module import initialize_optimization_module
+from Modules.imss_clean_module import IMSSModule, MedicamentoIMSS
+
+
+class IMSSModuleTestCase(unittest.TestCase):
+    """Módulo IMSS sobre una base temporal con el esquema ya creado"""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.modulo = IMSSModule(str(Path(self.tmpdir) / 'imss_medicamentos.db'))
+        self.modulo._init_database()
+    
+    def tearDown(self):
+        self.modulo.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+    
+    def store(self, *medicamentos: MedicamentoIMSS) -> int:
+        return self.modulo._add_medications_bulk(list(medicamentos))
+
+
+class SearchTest(IMSSModuleTestCase):
+    
+    def setUp(self):
+        super().setUp()
+        self.store(
+            MedicamentoIMSS(clave='010.000.1706.00', descripcion='ÁCIDO FÓLICO 5 MG TABLETA'),
+            MedicamentoIMSS(clave='010.000.0104.00', descripcion='PARACETAMOL 500 MG TABLETA',
+                            nombre_generico='PARACETAMOL')
+        )
+    
+    def test_non_ascii_uppercase_term(self):
+        for has_fts in (True, False):
+            with self.subTest(has_fts=has_fts):
+                self.modulo._has_fts = has_fts
+                self.modulo._invalidate_caches()
+                claves = [fila['clave'] for fila in self.modulo.search('CIDO FÓL')]
+                self.assertEqual(claves, ['010.000.1706.00'])
+    
+    def test_cache_is_keyed_by_normalized_term(self):
+        esperado = self.modulo.search('paracetamol')
+        self.assertEqual(len(esperado), 1)
+        self.assertEqual(self.modulo.search(' Paracetamol'), esperado)
+        self.assertEqual(self.modulo.search('PARACETAMOL'), esperado)
+        
+        info = self.modulo._search_cached.cache_info()
+        self.assertEqual((info.hits, info.misses), (2, 1))
+
+
+
+class ConditionalSyncTest(IMSSModuleTestCase):
+    
+    def setUp(self):
+        super().setUp()
+        # Validadores de una sincronización anterior para los dos catálogos
+        self.modulo._pending_sync_meta = {
+            url: ('"v1"', 'Mon, 12 Oct 2026 10:00:00 GMT', 'a' * 64)
+            for url in self.modulo.urls.values()
+        }
+        self.modulo._save_sync_meta()
+    
+    def test_not_modified_skips_reprocessing(self):
+        """Con 304 en todos los catálogos no se extrae, parsea ni escribe nada"""
+        respuesta = mock.MagicMock(status_code=304)
+        respuesta.__enter__.return_value = respuesta
+        
+        with mock.patch.object(self.modulo._session, 'get', return_value=respuesta) as get, \
+             mock.patch.object(self.modulo, '_extract_pdf_text') as extraer, \
+             mock.patch.object(self.modulo, '_add_medications_bulk') as guardar:
+            self.assertEqual(self.modulo.sync_data(), (True, "IMSS_SYNC_NOOP"))
+        
+        self.assertEqual(get.call_count, len(self.modulo.urls))
+        for llamada in get.call_args_list:
+            self.assertEqual(llamada.kwargs['headers']['If-None-Match'], '"v1"')
+            self.assertEqual(llamada.kwargs['headers']['If-Modified-Since'], 'Mon, 12 Oct 2026 10:00:00 GMT')
+        extraer.assert_not_called()
+        guardar.assert_not_called()
+
+
+
+class UpsertConsistencyTest(IMSSModuleTestCase):
+    """Una clave repetida se actualiza en su lugar sin desincronizar FTS, _counts ni resúmenes"""
+    
+    METFORMINA = MedicamentoIMSS(clave='010.000.5165.00', descripcion='METFORMINA 850 MG TABLETA',
+                                 grupo_terapeutico='Endocrinología')
+    
+    def setUp(self):
+        super().setUp()
+        self.store(
+            self.METFORMINA,
+            MedicamentoIMSS(clave='010.000.0104.00', descripcion='PARACETAMOL 500 MG TABLETA',
+                            grupo_terapeutico='Analgesia')
+        )
+        self.optimizer = initialize_optimization_module(str(self.modulo.db_path), use_counts_table=True)
+        self.optimizer.normalize_database()
+        self.assertEqual(self.summary_marker(), 1)
+        
+        self.store(MedicamentoIMSS(clave=self.METFORMINA.clave, descripcion='GLIBENCLAMIDA 5 MG TABLETA',
+                                   grupo_terapeutico='Diabetes'))
+    
+    def tearDown(self):
+        pool = optimization_module._POOLS.pop(str(Path(self.modulo.db_path).resolve()), None)
+        while pool is not None and not pool.empty():
+            pool.get_nowait().close()
+        super().tearDown()
+    
+    def query(self, sql: str):
+        return self.modulo._get_connection().execute(sql).fetchall()
+    
+    def summary_marker(self) -> int:
+        return self.query("SELECT COUNT(*) FROM metadatos_sistema WHERE clave = 'resumen_vigente'")[0][0]
+    
+    def test_fts_index_follows_the_update(self):
+        # Falla ("database disk image is malformed") si el índice no coincide con medicamentos
+        self.query("INSERT INTO medicamentos_fts(medicamentos_fts, rank) VALUES('integrity-check', 1)")
+        self.assertTrue(self.modulo._has_fts)
+        self.assertEqual(self.modulo.search('metformina'), [])
+        self.assertEqual([fila['clave'] for fila in self.modulo.search('glibenclamida')],
+                         [self.METFORMINA.clave])
+    
+    def test_counts_follow_the_update(self):
+        counts = dict(self.query("SELECT key, value FROM _counts"))
+        normalizados = self.query(
+            "SELECT COUNT(*) FROM medicamentos WHERE principio_activo_normalizado != ''"
+        )[0][0]
+        self.assertEqual(counts, {'total': 2, 'normalized': normalizados})
+    
+    def test_summary_is_invalidated(self):
+        self.assertEqual(self.summary_marker(), 0)
+        grupos = {g['group'] for g in self.optimizer.get_optimized_exploration()['therapeutic_groups']}
+        self.assertEqual(grupos, {'Diabetes', 'Analgesia'})
+
+
+if __name__ == '__main__':
+    unittest.main()
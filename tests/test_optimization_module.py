@@ -0,0 +1,74 @@
+"""
+Pruebas del módulo de optimización
+"""
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from Core import optimization_module
+
+
+class NormalizeInParallelTest(unittest.TestCase):
+    """Normalización repartida entre procesos (umbral bajado para forzarla)"""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = str(Path(self.tmpdir) / 'imss_medicamentos.db')
+        
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            CREATE TABLE medicamentos (
+                clave TEXT PRIMARY KEY,
+                descripcion TEXT,
+                nombre_generico TEXT,
+                grupo_terapeutico TEXT,
+                categoria_medicamento TEXT,
+                estado TEXT
+            )
+        ''')
+        conn.executemany(
+            "INSERT INTO medicamentos VALUES (?, ?, ?, ?, ?, 'activo')",
+            [
+                (f'010.000.{i:04d}.00', f'Clorhidrato de metformina {i} mg tableta',
+                 '' if i % 2 else 'Metformina', 'Endocrinología', 'Básico')
+                for i in range(40)
+            ]
+        )
+        conn.commit()
+        conn.close()
+    
+    def tearDown(self):
+        # Cerrar las conexiones del pool antes de borrar la base
+        pool = optimization_module._POOLS.pop(str(Path(self.db_path).resolve()), None)
+        while pool is not None and not pool.empty():
+            pool.get_nowait().close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+    
+    def test_parallel_branch_normalizes_every_row(self):
+        with mock.patch.object(optimization_module, '_PARALLEL_MIN_ROWS', 10), \
+                mock.patch.object(optimization_module.mp, 'cpu_count', return_value=4), \
+                mock.patch.object(optimization_module.IMSSOptimizationModule, '_normalize_in_parallel',
+                                  autospec=True,
+                                  side_effect=optimization_module.IMSSOptimizationModule._normalize_in_parallel) as paralelo:
+            modulo = optimization_module.initialize_optimization_module(self.db_path)
+            resultado = modulo.normalize_database()
+        
+        paralelo.assert_called_once()
+        self.assertEqual(resultado['medicamentos_actualizados'], 40)
+        self.assertEqual(resultado['principios_activos_encontrados'], 1)
+        
+        conn = sqlite3.connect(self.db_path)
+        try:
+            principios = {row[0] for row in conn.execute(
+                "SELECT principio_activo_normalizado FROM medicamentos"
+            )}
+        finally:
+            conn.close()
+        self.assertEqual(principios, {'METFORMINA'})
+
+
+if __name__ == '__main__':
+    unittest.main()